@@ -0,0 +1,71 @@
+"""
+Memoized Paystack account resolution
+
+Users re-verify the same account number repeatedly while filling in the
+bank account form, so bank/resolve results are cached per
+(account_number, bank_code): successful lookups for ACCOUNT_RESOLVE_TTL and
+rejected ones for the much shorter ACCOUNT_RESOLVE_NEGATIVE_TTL. Network
+failures are never cached. Concurrent lookups of the same account share one
+upstream call.
+"""
+
+import threading
+
+from flask import current_app
+
+from cache import LRUCache, SingleFlight
+from paystack_client import get_paystack_client, PaystackError
+
+class AccountResolver:
+    def __init__(self, config, maxsize=10000, ttl=86400, negative_ttl=60):
+        self.config = config
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = LRUCache(maxsize=maxsize, name='account_resolve')
+        self.flights = SingleFlight()
+        self.upstream_calls = 0
+        self._lock = threading.Lock()
+
+    def _fetch(self, key):
+        account_number, bank_code = key
+        with self._lock:
+            self.upstream_calls += 1
+        try:
+            response = get_paystack_client(self.config).get(
+                '/bank/resolve',
+                name='validate_bank_details',
+                params={'account_number': account_number, 'bank_code': bank_code}
+            )
+        except PaystackError as e:
+            return {'status': False, 'message': str(e)}
+
+        self.cache.set(key, response, ttl=self.ttl if response.get('status') else self.negative_ttl)
+        return response
+
+    def resolve(self, account_number, bank_code):
+        """Return the bank/resolve response for an account, cached when possible"""
+        key = (str(account_number), str(bank_code))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        return self.flights.do(key, lambda: self._fetch(key))
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['upstream_calls'] = self.upstream_calls
+        stats['shared_calls'] = self.flights.shared
+        return stats
+
+def get_account_resolver():
+    """Return the app's account resolver, creating it on first use"""
+    app = current_app._get_current_object()
+    resolver = app.extensions.get('account_resolver')
+    if resolver is None:
+        resolver = AccountResolver(
+            app.config,
+            maxsize=app.config.get('ACCOUNT_RESOLVE_CACHE_SIZE', 10000),
+            ttl=app.config.get('ACCOUNT_RESOLVE_TTL', 86400),
+            negative_ttl=app.config.get('ACCOUNT_RESOLVE_NEGATIVE_TTL', 60)
+        )
+        app.extensions['account_resolver'] = resolver
+    return resolver
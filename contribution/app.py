@@ -7,6 +7,14 @@ from config import Config
 from models import db, User, Transaction, Goal, BankAccount, DailyGoal, Notification
 from routes import main_bp
 from extensions import migrate, admin
+from commands import register_commands
+import database
+import images
+import assets
+import http_cache
+import fragment_cache
+import instrumentation
+import metrics
 from flask_mail import Mail
 
 def create_app():
@@ -14,7 +22,16 @@ def create_app():
     app.config.from_object(Config)
     
     # Initialize extensions
-    db.init_app(app)
+    database.init_app(app)
+    
+    # Per-request query stats, shown on the admin page
+    instrumentation.init_app(app)
+    
+    # Prometheus metrics at /metrics
+    metrics.init_app(app)
+    
+    # Initialize Flask-Admin
+    admin.init_app(app)
     
     # Initialize Flask-Login
     login_manager = LoginManager()
@@ -32,6 +49,21 @@ def create_app():
     # Register blueprints
     app.register_blueprint(main_bp)
     
+    # Register CLI commands
+    register_commands(app)
+    
+    # Profile image pipeline
+    images.init_app(app)
+    
+    # Fingerprinted static assets (after `flask assets build`)
+    assets.init_app(app)
+    
+    # Conditional GETs and gzip for the JSON API
+    http_cache.init_app(app)
+    
+    # Template fragment and bytecode caches
+    fragment_cache.init_app(app)
+    
     # Create upload folder
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
@@ -51,10 +83,7 @@ def create_app():
         if current_user.is_authenticated:
             return dict(
                 current_user=current_user,
-                unread_notifications=Notification.query.filter_by(
-                    user_id=current_user.id, 
-                    is_read=False
-                ).count()
+                unread_notifications=current_user.unread_notification_count
             )
         return dict()
     
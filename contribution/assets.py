@@ -0,0 +1,104 @@
+"""
+Fingerprinted, precompressed static assets
+
+`flask assets build` copies every stylesheet, script and SVG under static/
+to static/dist/ with a content hash in its name, writes .gz and .br
+variants next to it and records the mapping in static/dist/manifest.json.
+The build needs the brotli package (in requirements.txt); serving doesn't. While a manifest exists,
+url_for('static', filename=...) points at the hashed copy, which is served
+precompressed when the browser accepts it and cached for a year; a new
+build changes the names, so nothing is ever revalidated.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import request, send_from_directory
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+EXTENSIONS = ('.css', '.js', '.svg')
+SKIP_DIRS = (DIST_DIR, os.path.join('images', 'avatars'))
+FAR_FUTURE = 365 * 24 * 60 * 60
+
+def _source_files(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        relative_root = os.path.relpath(root, static_folder)
+        dirs[:] = [d for d in dirs if os.path.normpath(os.path.join(relative_root, d)) not in SKIP_DIRS]
+        for name in sorted(files):
+            if name.endswith(EXTENSIONS):
+                yield os.path.normpath(os.path.join(relative_root, name)).replace(os.sep, '/')
+
+def build_assets(static_folder):
+    """Write hashed and compressed copies of the static assets; returns the manifest
+
+    Raises ImportError, before writing anything, if brotli isn't installed.
+    """
+    import brotli
+
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    manifest = {}
+    for filename in _source_files(static_folder):
+        with open(os.path.join(static_folder, filename), 'rb') as f:
+            content = f.read()
+        stem, ext = os.path.splitext(filename)
+        hashed = f'{DIST_DIR}/{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+        path = os.path.join(static_folder, hashed)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'wb') as f:
+            f.write(content)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(content))
+        manifest[filename] = hashed
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def init_app(app):
+    manifest = load_manifest(app.static_folder)
+    app.extensions['asset_manifest'] = manifest
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    @app.before_request
+    def serve_precompressed():
+        if request.endpoint != 'static':
+            return None
+        filename = request.view_args.get('filename', '')
+        if not filename.startswith(DIST_DIR + '/'):
+            return None
+
+        accepted = request.accept_encodings
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+                response = send_from_directory(app.static_folder, filename + suffix,
+                                               mimetype=mimetypes.guess_type(filename)[0], max_age=FAR_FUTURE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(app.static_folder, filename, max_age=FAR_FUTURE)
+
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
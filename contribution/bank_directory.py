@@ -0,0 +1,140 @@
+"""
+Cached directory of Nigerian banks
+
+The bank list changes rarely, so it is served from memory, refreshed in the
+background once it is older than BANK_LIST_TTL, and persisted to a JSON
+snapshot so a freshly started worker can answer immediately. If Paystack is
+slow or down the last good copy keeps being served, and a failed refresh
+isn't tried again for BANK_LIST_RETRY_SECONDS, so an outage doesn't turn
+every request into another upstream call.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+from paystack_client import get_paystack_client, PaystackError
+
+logger = logging.getLogger(__name__)
+
+class BankDirectory:
+    def __init__(self, config, snapshot_path, ttl, retry_seconds=60):
+        self.config = config
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self.retry_seconds = retry_seconds
+        self.banks = None
+        self.etag = None
+        self.upstream_etag = None
+        self.fetched_at = 0.0
+        self.retry_after = 0.0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+        self._load_snapshot()
+
+    def _set(self, banks, fetched_at, upstream_etag):
+        payload = json.dumps(banks, sort_keys=True, separators=(',', ':'))
+        self.banks = banks
+        self.etag = hashlib.sha1(payload.encode()).hexdigest()
+        self.fetched_at = fetched_at
+        self.upstream_etag = upstream_etag
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            self._set(snapshot['banks'], snapshot['fetched_at'], snapshot.get('upstream_etag'))
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _write_snapshot(self):
+        tmp_path = f'{self.snapshot_path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'banks': self.banks,
+                    'fetched_at': self.fetched_at,
+                    'upstream_etag': self.upstream_etag
+                }, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.warning('Could not write bank list snapshot: %s', e)
+
+    def refresh(self):
+        """Fetch the list from Paystack; keeps the old copy on failure"""
+        try:
+            body, upstream_etag = get_paystack_client(self.config).get_conditional(
+                '/bank',
+                etag=self.upstream_etag if self.banks is not None else None,
+                name='get_banks_list',
+                params={'country': 'nigeria', 'perPage': 100}
+            )
+            with self._lock:
+                if body is None:
+                    # 304: our copy is still current
+                    self.fetched_at = time.time()
+                elif body.get('status'):
+                    banks = [{'code': bank['code'], 'name': bank['name']} for bank in body.get('data', [])]
+                    self._set(banks, time.time(), upstream_etag)
+                else:
+                    raise PaystackError(body.get('message', 'Failed to fetch banks'))
+                self.last_error = None
+                self.retry_after = 0.0
+            self._write_snapshot()
+        except PaystackError as e:
+            with self._lock:
+                self.last_error = str(e)
+                self.retry_after = time.time() + self.retry_seconds
+            logger.warning('Bank list refresh failed, serving stale copy: %s', e)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='bank-directory-refresh', daemon=True).start()
+
+    def _state(self):
+        with self._lock:
+            return self.banks, self.etag, self.fetched_at, self.retry_after
+
+    def get(self):
+        """Return (banks, etag); banks is None only if nothing was ever fetched"""
+        banks, etag, fetched_at, retry_after = self._state()
+        now = time.time()
+        if banks is None and now >= retry_after:
+            # Concurrent cold requests share one upstream call
+            with self._fetch_lock:
+                banks, etag, fetched_at, retry_after = self._state()
+                if banks is None and time.time() >= retry_after:
+                    self.refresh()
+                    banks, etag, fetched_at, retry_after = self._state()
+        elif banks is not None and now - fetched_at > self.ttl and now >= retry_after:
+            self._refresh_in_background()
+        return banks, etag
+
+def get_bank_directory():
+    """Return the app's bank directory, creating it on first use"""
+    app = current_app._get_current_object()
+    directory = app.extensions.get('bank_directory')
+    if directory is None:
+        snapshot_path = app.config.get('BANK_LIST_SNAPSHOT') or os.path.join(app.instance_path, 'banks.json')
+        directory = BankDirectory(app.config, snapshot_path, app.config.get('BANK_LIST_TTL', 86400),
+                                  retry_seconds=app.config.get('BANK_LIST_RETRY_SECONDS', 60))
+        app.extensions['bank_directory'] = directory
+    return directory
@@ -0,0 +1,348 @@
+"""
+Flask CLI commands for maintaining derived data
+"""
+
+import time
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models import (db, User, compute_user_balances, bump_data_version,
+                    reconcile_unread_counts, rebuild_rollups)
+
+balances_cli = AppGroup('balances', help='Maintain the materialized user balances.')
+rollups_cli = AppGroup('rollups', help='Maintain the transaction rollup tables.')
+notifications_cli = AppGroup('notifications', help='Maintain notification counters and retention.')
+events_cli = AppGroup('events', help='Maintain the live update event log.')
+jobs_cli = AppGroup('jobs', help='Run the background job queue.')
+payments_cli = AppGroup('payments', help='Reconcile pending payments with Paystack.')
+webhooks_cli = AppGroup('webhooks', help='Export and replay Paystack webhook events.')
+assets_cli = AppGroup('assets', help='Build the fingerprinted static assets.')
+schema_cli = AppGroup('schema', help='Upgrade the database schema on SQLite or PostgreSQL.')
+loadtest_cli = AppGroup('loadtest', help='Seed synthetic data and load test the app.')
+users_cli = AppGroup('users', help='Manage user accounts.')
+
+@balances_cli.command('verify')
+@click.option('--user-id', type=int, default=None, help='Only check this user.')
+def verify_balances(user_id):
+    """Compare stored balances against the transaction history"""
+    expected = compute_user_balances(user_id)
+    query = User.query
+    if user_id is not None:
+        query = query.filter_by(id=user_id)
+
+    mismatches = 0
+    for user in query.yield_per(1000):
+        actual = user.balance or 0.0
+        wanted = expected.get(user.id, 0.0)
+        if abs(actual - wanted) > 0.005:
+            mismatches += 1
+            click.echo(f'user {user.id}: stored {actual:,.2f}, expected {wanted:,.2f}')
+
+    if mismatches:
+        raise click.ClickException(f'{mismatches} balance(s) out of sync')
+    click.echo('All balances match the transaction history')
+
+@balances_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+def rebuild_balances(user_id):
+    """Recompute stored balances from the transaction history"""
+    expected = compute_user_balances(user_id)
+    query = db.session.query(User.id)
+    if user_id is not None:
+        query = query.filter(User.id == user_id)
+
+    updates = [{'id': uid, 'balance': expected.get(uid, 0.0)} for (uid,) in query]
+    if updates:
+        db.session.execute(db.update(User), updates)
+        bump_data_version(db.session.connection(), [row['id'] for row in updates])
+    db.session.commit()
+    click.echo(f'Rebuilt {len(updates)} balance(s)')
+
+@rollups_cli.command('backfill')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+@click.option('--batch-size', type=int, default=200, show_default=True, help='Users per commit.')
+def backfill_rollups(user_id, batch_size):
+    """Rebuild the rollup rows from the completed transaction history"""
+    query = db.session.query(User.id).order_by(User.id)
+    if user_id is not None:
+        query = query.filter(User.id == user_id)
+    user_ids = [uid for (uid,) in query]
+
+    written = rebuild_rollups(user_ids, batch_size)
+    click.echo(f'Wrote {written} rollup row(s) for {len(user_ids)} user(s)')
+
+@notifications_cli.command('reconcile')
+@click.option('--interval', type=int, default=0,
+              help='Keep running, reconciling every INTERVAL seconds.')
+def reconcile_notifications(interval):
+    """Repair drift in the cached unread notification counters"""
+    while True:
+        fixed = reconcile_unread_counts()
+        click.echo(f'Reconciled unread counters, {len(fixed)} corrected')
+        if interval <= 0:
+            break
+        time.sleep(interval)
+
+@notifications_cli.command('archive')
+@click.option('--days', type=int, default=None, help='Defaults to NOTIFICATION_RETENTION_DAYS; 0 disables.')
+@click.option('--max-per-user', type=int, default=None, help='Defaults to NOTIFICATION_MAX_PER_USER; 0 disables.')
+@click.option('--batch-size', type=int, default=None, help='Defaults to NOTIFICATION_ARCHIVE_BATCH_SIZE.')
+def archive_old_notifications(days, max_per_user, batch_size):
+    """Move old read and excess notifications to the archive table"""
+    from retention import archive_notifications
+
+    config = current_app.config
+    expired, overflow = archive_notifications(
+        retention_days=days if days is not None else config.get('NOTIFICATION_RETENTION_DAYS', 90),
+        max_per_user=max_per_user if max_per_user is not None else config.get('NOTIFICATION_MAX_PER_USER', 500),
+        batch_size=batch_size or config.get('NOTIFICATION_ARCHIVE_BATCH_SIZE', 500)
+    )
+    click.echo(f'Archived {expired} expired and {overflow} excess notification(s)')
+
+@events_cli.command('prune')
+@click.option('--max-age-hours', type=int, default=None,
+              help='Defaults to EVENT_RETENTION_HOURS.')
+def prune_event_log(max_age_hours):
+    """Delete live update events nobody will replay any more"""
+    from pubsub import prune_events
+
+    hours = max_age_hours if max_age_hours is not None else current_app.config.get('EVENT_RETENTION_HOURS', 24)
+    removed = prune_events(timedelta(hours=hours))
+    click.echo(f'Pruned {removed} event(s) older than {hours}h')
+
+@jobs_cli.command('work')
+@click.option('--concurrency', type=int, default=None, help='Worker threads; defaults to JOB_CONCURRENCY.')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+def work_jobs(concurrency, burst):
+    """Process queued jobs until interrupted"""
+    from jobs import Worker
+    import withdrawals, webhooks  # noqa: F401 register their job handlers
+
+    config = current_app.config
+    worker = Worker(
+        current_app._get_current_object(),
+        concurrency=concurrency or config.get('JOB_CONCURRENCY', 4),
+        poll_interval=config.get('JOB_POLL_INTERVAL', 1),
+        lock_timeout=config.get('JOB_LOCK_TIMEOUT', 300)
+    )
+    click.echo(f'Worker {worker.worker_id} running {worker.concurrency} thread(s)')
+    worker.run(burst=burst)
+    click.echo(f'Processed {worker.processed} job(s), {worker.failed} failed attempt(s)')
+
+@payments_cli.command('reconcile')
+@click.option('--batch-size', type=int, default=None, help='Defaults to RECONCILE_BATCH_SIZE.')
+@click.option('--concurrency', type=int, default=None, help='Defaults to RECONCILE_CONCURRENCY.')
+@click.option('--min-age-minutes', type=int, default=None, help='Defaults to RECONCILE_MIN_AGE_MINUTES.')
+@click.option('--interval', type=int, default=0,
+              help='Keep running, reconciling every INTERVAL seconds.')
+def reconcile_payments(batch_size, concurrency, min_age_minutes, interval):
+    """Settle aged pending deposits and withdrawals against Paystack"""
+    from reconciler import reconcile_pending
+
+    config = current_app.config
+    if min_age_minutes is None:
+        min_age_minutes = config.get('RECONCILE_MIN_AGE_MINUTES', 15)
+    while True:
+        report = reconcile_pending(
+            current_app._get_current_object(),
+            min_age=timedelta(minutes=min_age_minutes),
+            expire_after=timedelta(hours=config.get('RECONCILE_EXPIRE_HOURS', 24)),
+            batch_size=batch_size or config.get('RECONCILE_BATCH_SIZE', 100),
+            concurrency=concurrency or config.get('RECONCILE_CONCURRENCY', 8)
+        )
+        stats = report.to_dict()
+        click.echo(
+            f"Checked {stats['checked']} pending payment(s) in {stats['elapsed_seconds']}s "
+            f"({stats['checks_per_second']}/s): {stats['completed']} completed, {stats['failed']} failed, "
+            f"{stats['still_pending']} still pending, {stats['errors']} error(s); "
+            f"oldest {stats['oldest_pending_seconds']}s, mean settle lag {stats['mean_settle_lag_seconds']}s"
+        )
+        if stats['unresolved']:
+            click.echo(f"{len(stats['unresolved'])} expired withdrawal(s) Paystack has no transfer for, "
+                       f"left pending for manual review: {', '.join(stats['unresolved'])}")
+        if interval <= 0:
+            break
+        time.sleep(interval)
+
+@webhooks_cli.command('export')
+@click.argument('output', type=click.File('w'))
+@click.option('--event', 'event_type', default=None, help='Only export this event type.')
+def export_webhooks(output, event_type):
+    """Write stored webhook bodies to OUTPUT, one per line"""
+    from models import WebhookEvent
+
+    query = db.session.query(WebhookEvent.payload).order_by(WebhookEvent.id)
+    if event_type:
+        query = query.filter(WebhookEvent.event == event_type)
+    count = 0
+    for (payload,) in query.yield_per(1000):
+        output.write(payload.replace('\n', ' ') + '\n')
+        count += 1
+    click.echo(f'Exported {count} event(s)')
+
+@webhooks_cli.command('replay')
+@click.argument('events', type=click.File('rb'))
+@click.option('--url', default='http://127.0.0.1:5000/webhooks/paystack', show_default=True)
+@click.option('--concurrency', type=int, default=8, show_default=True)
+def replay_webhooks(events, url, concurrency):
+    """POST recorded events (one JSON body per line) to a running app"""
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+    import requests
+    from webhooks import sign
+
+    secret = current_app.config['PAYSTACK_SECRET_KEY']
+    bodies = [line.strip() for line in events if line.strip()]
+    session = requests.Session()
+    session.mount(url, requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def post(body):
+        try:
+            return session.post(url, data=body, timeout=30, headers={
+                'Content-Type': 'application/json',
+                'x-paystack-signature': sign(secret, body)
+            }).status_code
+        except requests.RequestException:
+            return 'error'
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = Counter(pool.map(post, bodies))
+    elapsed = time.perf_counter() - started
+
+    rate = len(bodies) / elapsed if elapsed else 0.0
+    summary = ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items(), key=str))
+    click.echo(f'Replayed {len(bodies)} event(s) in {elapsed:.2f}s ({rate:.1f}/s) - {summary}')
+
+@assets_cli.command('build')
+def build_static_assets():
+    """Write hashed, precompressed copies of the static assets"""
+    from assets import build_assets
+
+    try:
+        manifest = build_assets(current_app.static_folder)
+    except ImportError as e:
+        raise click.ClickException(f'{e}; install the requirements (brotli) to build the assets')
+    click.echo(f'Built {len(manifest)} asset(s) with gzip and brotli; restart the app to pick up the manifest')
+
+@schema_cli.command('upgrade')
+def upgrade_schema():
+    """Create missing tables, columns and indexes"""
+    from schema import upgrade
+
+    changes = upgrade()
+    for change in changes:
+        click.echo(f'Added {change}')
+    click.echo(f'Schema is up to date ({len(changes)} change(s))')
+
+@loadtest_cli.command('seed')
+@click.option('--users', type=int, default=1000, show_default=True)
+@click.option('--transactions', type=int, default=500, show_default=True, help='Per user.')
+@click.option('--goals', type=int, default=5, show_default=True, help='Per user.')
+@click.option('--daily-goals', type=int, default=30, show_default=True, help='Per user.')
+@click.option('--notifications', type=int, default=50, show_default=True, help='Per user.')
+@click.option('--bank-accounts', type=int, default=1, show_default=True, help='Per user.')
+@click.option('--history-days', type=int, default=365, show_default=True, help='Spread rows over this many days.')
+@click.option('--batch-size', type=int, default=200, show_default=True, help='Users per commit.')
+@click.option('--prefix', default='loadtest', show_default=True, help='Username and email prefix.')
+@click.option('--seed', 'random_seed', type=int, default=0, show_default=True, help='Random seed.')
+def seed_load_data(users, transactions, goals, daily_goals, notifications, bank_accounts,
+                   history_days, batch_size, prefix, random_seed):
+    """Insert synthetic users with their history"""
+    from loadtest import seed
+
+    started = time.monotonic()
+    counts = seed(
+        users, transactions=transactions, goals=goals, daily_goals=daily_goals,
+        notifications=notifications, bank_accounts=bank_accounts, history_days=history_days,
+        batch_size=batch_size, prefix=prefix, random_seed=random_seed,
+        progress=lambda done: click.echo(f'{done} user(s) written', err=True)
+    )
+    for table, count in counts.items():
+        click.echo(f'{table}: {count} row(s)')
+    click.echo(f'Seeded in {time.monotonic() - started:.1f}s')
+
+@loadtest_cli.command('stub')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', type=int, default=8099, show_default=True)
+@click.option('--latency-ms', type=int, default=0, show_default=True, help='Delay added to every response.')
+def run_paystack_stub(host, port, latency_ms):
+    """Serve a local Paystack stand-in until interrupted"""
+    from loadtest import PaystackStub
+
+    server = PaystackStub((host, port), latency=latency_ms / 1000)
+    click.echo(f'Paystack stub on http://{host}:{port}; start the app with PAYSTACK_BASE_URL set to it')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+@loadtest_cli.command('run')
+@click.argument('base_url')
+@click.option('--users', type=int, default=10, show_default=True, help='Concurrent virtual users.')
+@click.option('--duration', type=int, default=60, show_default=True, help='Seconds.')
+@click.option('--accounts', type=int, default=None, help='Seeded accounts to sign in as; defaults to --users.')
+@click.option('--prefix', default='loadtest', show_default=True, help='Prefix the accounts were seeded with.')
+@click.option('--deposit-ratio', type=float, default=0.1, show_default=True, help='Deposits per iteration.')
+@click.option('--withdraw-ratio', type=float, default=0.05, show_default=True, help='Withdrawals per iteration.')
+@click.option('--think-time', type=float, default=0.0, show_default=True, help='Mean seconds between iterations.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Also write the report as JSON.')
+def run_load_test(base_url, users, duration, accounts, prefix, deposit_ratio, withdraw_ratio, think_time, output):
+    """Drive a running app at BASE_URL and report latency per endpoint"""
+    import json
+    import subprocess
+    from loadtest import run_load
+
+    report = run_load(base_url, users=users, duration=duration, accounts=accounts, prefix=prefix,
+                      deposit_ratio=deposit_ratio, withdraw_ratio=withdraw_ratio, think_time=think_time)
+    try:
+        report['commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                          cwd=current_app.root_path).stdout.strip() or None
+    except OSError:
+        report['commit'] = None
+
+    click.echo(f"{'endpoint':<40} {'reqs':>7} {'errs':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+    for name, stats in list(report['endpoints'].items()) + [('TOTAL', report['total'])]:
+        click.echo(f"{name:<40} {stats['requests']:>7} {stats['errors']:>5} {stats['p50_ms'] or 0:>8} "
+                   f"{stats['p95_ms'] or 0:>8} {stats['p99_ms'] or 0:>8} {stats['throughput'] or 0:>8}")
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        click.echo(f'Report written to {output}')
+
+@users_cli.command('grant-admin')
+@click.option('--revoke', is_flag=True, help='Take admin access away instead.')
+def grant_admin(revoke):
+    """Give the ADMIN_EMAIL account admin access
+
+    Anyone can sign up with ADMIN_EMAIL, so check the account is yours
+    before confirming.
+    """
+    email = current_app.config['ADMIN_EMAIL']
+    user = User.query.filter(db.func.lower(User.email) == email.lower()).first()
+    if user is None:
+        raise click.ClickException(f'No account uses {email}')
+    if not revoke:
+        click.echo(f'{user.username} ({user.first_name} {user.last_name}), signed up {user.created_at:%Y-%m-%d %H:%M}')
+        click.confirm('Grant this account admin access?', abort=True)
+    user.is_admin = not revoke
+    db.session.commit()
+    click.echo(f"Admin access {'revoked from' if revoke else 'granted to'} {email}")
+
+def register_commands(app):
+    app.cli.add_command(balances_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(notifications_cli)
+    app.cli.add_command(events_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(payments_cli)
+    app.cli.add_command(webhooks_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(loadtest_cli)
+    app.cli.add_command(users_cli)
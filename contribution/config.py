@@ -5,11 +5,23 @@ load_dotenv()
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///money_saver.db'
+    # DATABASE_URL selects the backend: postgresql://... in production, SQLite otherwise
+    SQLALCHEMY_DATABASE_URI = (os.environ.get('DATABASE_URL') or 'sqlite:///money_saver.db').replace('postgres://', 'postgresql://', 1)
     PAYSTACK_SECRET_KEY = 'sk_test_4c623beabaa6f43be5fc5872756186bc764118c1'
     PAYSTACK_PUBLIC_KEY = 'pk_test_f32edffba7422d4719caf11a35ee2db5d77eb8db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Database settings
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)  # PostgreSQL connections kept per process
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+    DB_POOL_TIMEOUT = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = 1800  # seconds; below the server's and any proxy's idle timeout
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'  # durable with WAL without an fsync per commit
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)  # ms a writer waits for the lock
+    REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')  # read-only views use it when set
+    REPLICA_STICKY_SECONDS = 5  # reads stay on the primary this long after a user's write
+    
     # Mail settings
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
@@ -20,14 +32,80 @@ class Config:
     # Paystack settings
     PAYSTACK_SECRET_KEY = 'sk_test_4c623beabaa6f43be5fc5872756186bc764118c1'
     PAYSTACK_PUBLIC_KEY = 'pk_test_f32edffba7422d4719caf11a35ee2db5d77eb8db'
+    PAYSTACK_BASE_URL = os.environ.get('PAYSTACK_BASE_URL') or 'https://api.paystack.co'
+    PAYSTACK_CONNECT_TIMEOUT = 3.05  # seconds
+    PAYSTACK_READ_TIMEOUT = 10  # seconds
+    PAYSTACK_POOL_CONNECTIONS = 4
+    PAYSTACK_POOL_MAXSIZE = 16  # keep-alive connections per worker
+    PAYSTACK_MAX_RETRIES = 2  # GETs and connection failures only
+    PAYSTACK_BACKOFF_FACTOR = 0.3
+    PAYSTACK_BACKOFF_JITTER = 0.2
+    
+    # Bank list cache settings
+    BANK_LIST_TTL = 24 * 60 * 60  # refresh from Paystack in the background after this
+    BANK_LIST_BROWSER_MAX_AGE = 60 * 60
+    BANK_LIST_RETRY_SECONDS = 60  # wait this long after a failed refresh before asking Paystack again
+    BANK_LIST_SNAPSHOT = None  # defaults to instance/banks.json
+    
+    # Account resolution cache settings
+    ACCOUNT_RESOLVE_CACHE_SIZE = 10000
+    ACCOUNT_RESOLVE_TTL = 24 * 60 * 60  # successful lookups
+    ACCOUNT_RESOLVE_NEGATIVE_TTL = 60  # rejected lookups; network errors aren't cached
+    
+    # Job queue settings
+    JOB_CONCURRENCY = 4  # worker threads per `flask jobs work` process
+    JOB_POLL_INTERVAL = 1  # seconds between checks when the queue is empty
+    JOB_MAX_ATTEMPTS = 5
+    JOB_RETRY_BACKOFF = 30  # seconds, doubled after each failed attempt
+    JOB_LOCK_TIMEOUT = 5 * 60  # a running job is reclaimed after this
+    WITHDRAWAL_BATCH_SIZE = 100  # withdrawals per Paystack bulk transfer (max 100); 1 disables bulk mode
+    WITHDRAWAL_BATCH_WINDOW = 5  # seconds a withdrawal waits for others to batch with
+    
+    # Pending payment reconciliation settings
+    RECONCILE_MIN_AGE_MINUTES = 15  # leave younger payments to the browser's own checks
+    RECONCILE_EXPIRE_HOURS = 24  # fail payments Paystack still doesn't know after this
+    RECONCILE_BATCH_SIZE = 100
+    RECONCILE_CONCURRENCY = 8  # parallel Paystack checks
     
     # Upload settings
     UPLOAD_FOLDER = 'static/images'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    PROFILE_IMAGE_SIZES = {'sm': 64, 'md': 150, 'lg': 300}  # square edge in pixels
+    PROFILE_IMAGE_QUALITY = 85
+    IMAGE_PIPELINE_WORKERS = 2  # threads per web worker resizing uploads
     
     # App settings
     TRANSACTIONS_PER_PAGE = 10
     GOALS_PER_PAGE = 10
     
+    # Cache settings
+    DASHBOARD_CACHE_SIZE = 2048  # dashboard snapshots kept per worker
+    FRAGMENT_CACHE_SIZE = 4096  # rendered template fragments kept per worker
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')  # defaults to instance/jinja_cache
+    COMPRESS_MIN_SIZE = 1024  # gzip JSON responses at least this many bytes
+    COMPRESS_LEVEL = 6
+    
+    # Live update stream settings
+    EVENT_STREAM_MAX_SECONDS = 55  # clients reconnect with Last-Event-ID after this
+    EVENT_POLL_INTERVAL = 5  # seconds between each process's checks for events from other workers
+    EVENT_KEEPALIVE_SECONDS = 15
+    # Each open stream holds a worker thread; gunicorn.conf.py sizes this from its thread count
+    EVENT_STREAM_SLOTS = int(os.environ.get('EVENT_STREAM_SLOTS', 12))  # open streams per process
+    EVENT_STREAM_BUSY_RETRY_SECONDS = 30  # pages turned away when every slot is taken reconnect after this
+    EVENT_RETENTION_HOURS = 24
+    
+    # Notification retention settings (flask notifications archive)
+    NOTIFICATION_RETENTION_DAYS = 90  # archive read notifications older than this
+    NOTIFICATION_MAX_PER_USER = 500  # archive anything beyond each user's newest N
+    NOTIFICATION_ARCHIVE_BATCH_SIZE = 500
+    
+    # Query instrumentation settings (admin page at /admin/queries)
+    QUERY_DEBUG_HEADERS = os.environ.get('QUERY_DEBUG_HEADERS', 'false').lower() in ['true', 'on', '1']  # X-Query-Count and Server-Timing
+    QUERY_REPEAT_THRESHOLD = 5  # runs of one statement in a request flagged as a likely N+1
+    QUERY_SLOWEST_KEPT = 10  # slowest statements kept per endpoint
+    
+    # Metrics settings (PROMETHEUS_MULTIPROC_DIR is set in gunicorn.conf.py)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # /metrics requires 'Authorization: Bearer <token>'; unset, it answers 404
+    
     # Admin settings
     ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL') or 'admin@example.com'
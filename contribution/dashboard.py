@@ -0,0 +1,119 @@
+"""
+Dashboard snapshot service
+
+Builds everything the dashboard renders for a user in a handful of indexed
+queries and caches it per worker, keyed on the user's data version so any
+write to their transactions, goals, daily goals or notifications makes the
+cached copy unreachable. Rows are cached as plain dicts of the fields the
+template shows, never as ORM instances, so a snapshot doesn't depend on the
+session that built it.
+"""
+
+from datetime import datetime
+
+from flask import current_app
+
+from cache import LRUCache
+from models import db, Transaction, Goal, DailyGoal, Notification
+
+_snapshots = None
+
+def _snapshot_cache():
+    global _snapshots
+    if _snapshots is None:
+        _snapshots = LRUCache(maxsize=current_app.config.get('DASHBOARD_CACHE_SIZE', 2048), name='dashboard')
+    return _snapshots
+
+def _rows(query):
+    return [row._asdict() for row in query]
+
+class DashboardSnapshot:
+    """What the dashboard shows for one user at one data version"""
+
+    def __init__(self, user_id, data_version, day, total_savings, total_goals,
+                 completed_goals, recent_transactions, active_goals, today_goal,
+                 notifications):
+        self.user_id = user_id
+        self.data_version = data_version
+        self.day = day
+        self.total_savings = total_savings
+        self.total_goals = total_goals
+        self.completed_goals = completed_goals
+        self.recent_transactions = recent_transactions
+        self.active_goals = active_goals
+        self.today_goal = today_goal
+        self.notifications = notifications
+
+    @classmethod
+    def build(cls, user):
+        """Load the snapshot from the database"""
+        today = datetime.utcnow().date()
+
+        # Goal counters in one aggregate instead of two COUNT queries
+        total_goals, completed_goals = db.session.query(
+            db.func.count(Goal.id),
+            db.func.coalesce(db.func.sum(db.case((Goal.status == 'completed', 1), else_=0)), 0)
+        ).filter(Goal.user_id == user.id).one()
+
+        recent_transactions = _rows(
+            db.session.query(Transaction.created_at, Transaction.type, Transaction.amount, Transaction.description)
+            .filter(Transaction.user_id == user.id)
+            .order_by(Transaction.created_at.desc()).limit(5)
+        )
+
+        # The row has the columns get_progress_percentage reads
+        active_goals = [
+            dict(goal._asdict(), progress=Goal.get_progress_percentage(goal))
+            for goal in db.session.query(Goal.title, Goal.current_amount, Goal.target_amount)
+            .filter(Goal.user_id == user.id, Goal.status == 'active')
+            .order_by(Goal.deadline.asc()).limit(3)
+        ]
+
+        today_goal = next(iter(_rows(
+            db.session.query(DailyGoal.amount)
+            .filter(DailyGoal.user_id == user.id, DailyGoal.date == today).limit(1)
+        )), None)
+
+        notifications = _rows(
+            db.session.query(Notification.type, Notification.title, Notification.message)
+            .filter(Notification.user_id == user.id)
+            .order_by(Notification.created_at.desc()).limit(5)
+        )
+
+        return cls(
+            user_id=user.id,
+            data_version=user.data_version,
+            day=today,
+            total_savings=user.get_total_savings(),
+            total_goals=total_goals,
+            completed_goals=completed_goals,
+            recent_transactions=recent_transactions,
+            active_goals=active_goals,
+            today_goal=today_goal,
+            notifications=notifications
+        )
+
+    @classmethod
+    def for_user(cls, user):
+        """Return the cached snapshot if it is still current, else rebuild it"""
+        cache = _snapshot_cache()
+        snapshot = cache.get(user.id)
+        if (snapshot is not None
+                and snapshot.data_version == user.data_version
+                and snapshot.day == datetime.utcnow().date()):
+            return snapshot
+
+        snapshot = cls.build(user)
+        cache.set(user.id, snapshot)
+        return snapshot
+
+    def template_context(self):
+        return {
+            'total_savings': self.total_savings,
+            'total_goals': self.total_goals,
+            'completed_goals': self.completed_goals,
+            'recent_transactions': self.recent_transactions,
+            'active_goals': self.active_goals,
+            'today_goal': self.today_goal,
+            'notifications': self.notifications
+        }
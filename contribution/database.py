@@ -0,0 +1,68 @@
+"""
+Database engine configuration
+
+DATABASE_URL picks the backend. PostgreSQL, the production profile, gets a
+bounded connection pool whose connections are pre-pinged and recycled, so
+connections dropped by the server or a proxy are replaced instead of
+failing a request. SQLite connections are switched to WAL journaling with
+synchronous=NORMAL and a busy timeout, so readers never block the writer
+and concurrent gunicorn workers wait for the write lock instead of failing
+with "database is locked".
+
+REPLICA_DATABASE_URL adds a 'replica' engine with the same settings for
+read-only views (replicas.py). Both backends are brought up to date by
+`flask schema upgrade` (schema.py).
+"""
+
+from sqlalchemy import event
+
+from models import db
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+def engine_options(uri, config):
+    """Engine options for the backend at uri"""
+    if is_sqlite(uri):
+        return {}
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True
+    }
+
+def sqlite_pragmas(config):
+    return (
+        ('journal_mode', config.get('SQLITE_JOURNAL_MODE', 'WAL')),
+        ('synchronous', config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', int(config.get('SQLITE_BUSY_TIMEOUT', 5000))),
+    )
+
+def init_app(app):
+    """Initialise db for app with the backend's engine settings"""
+    config = app.config
+    options = engine_options(config['SQLALCHEMY_DATABASE_URI'], config)
+    # Anything set explicitly in SQLALCHEMY_ENGINE_OPTIONS wins
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    replica_url = config.get('REPLICA_DATABASE_URL')
+    if replica_url:
+        # Read-only views use it through replicas.read_replica
+        config.setdefault('SQLALCHEMY_BINDS', {})['replica'] = {'url': replica_url, **engine_options(replica_url, config)}
+    db.init_app(app)
+
+    pragmas = sqlite_pragmas(config)
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', apply_pragmas)
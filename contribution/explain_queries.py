@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Index advisor for the Money Saver models
+
+Seeds a scratch SQLite database, drives the routes with a logged-in test
+client while recording every SELECT they issue, then runs EXPLAIN QUERY PLAN
+over each distinct statement. Exits non-zero if any of them falls back to a
+full table scan.
+"""
+
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\S+)$')
+
+def build_app(db_path):
+    """Create the app against a scratch database"""
+    from config import Config
+    Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+    Config.WTF_CSRF_ENABLED = False
+    Config.TESTING = True
+
+    from app import create_app
+    return create_app()
+
+def seed(db, users=3, rows_per_user=200):
+    """Fill the scratch database with a few users' worth of history"""
+    from models import User, Transaction, Goal, BankAccount, DailyGoal, Notification
+
+    now = datetime.utcnow()
+    for u in range(users):
+        user = User(
+            username=f'advisor{u}',
+            email=f'advisor{u}@example.com',
+            first_name='Index',
+            last_name='Advisor'
+        )
+        user.set_password('password')
+        db.session.add(user)
+        db.session.flush()
+
+        for i in range(rows_per_user):
+            created = now - timedelta(hours=i)
+            db.session.add(Transaction(
+                user_id=user.id,
+                amount=100 + i,
+                type='deposit' if i % 3 else 'withdrawal',
+                category='salary' if i % 3 else 'bills',
+                reference=f'ADV{u}-{i}',
+                status='completed' if i % 4 else 'pending',
+                created_at=created,
+                completed_at=created if i % 4 else None
+            ))
+            db.session.add(Notification(
+                user_id=user.id,
+                title='Seeded',
+                message=f'Notification {i}',
+                is_read=bool(i % 2),
+                created_at=created
+            ))
+            db.session.add(DailyGoal(
+                user_id=user.id,
+                amount=50,
+                date=(now - timedelta(days=i)).date(),
+                created_at=created
+            ))
+            if i % 10 == 0:
+                db.session.add(Goal(
+                    user_id=user.id,
+                    title=f'Goal {i}',
+                    target_amount=10000,
+                    current_amount=i * 10,
+                    deadline=now + timedelta(days=i),
+                    status='completed' if i % 20 == 0 else 'active',
+                    category='other',
+                    created_at=created
+                ))
+        db.session.add(BankAccount(
+            user_id=user.id,
+            bank_name='Test Bank',
+            account_number=f'{u:010d}',
+            account_name='Index Advisor',
+            bank_code='000',
+            is_verified=True
+        ))
+    db.session.commit()
+
+def exercise(app, client):
+    """Issue the requests and helper calls whose queries we want to check"""
+    from models import Goal
+    from utils import get_monthly_summary, get_financial_insights, generate_report
+    from jobs import claim_jobs
+    from reconciler import pending_batches
+    from retention import archive_notifications
+
+    client.post('/login', data={'email': 'advisor0@example.com', 'password': 'password'})
+
+    pages = [
+        '/dashboard',
+        '/transactions',
+        '/goals',
+        '/daily-goals',
+        '/notifications',
+        '/bank-accounts',
+        '/deposit',
+        '/withdraw',
+        '/profile',
+        '/api/notifications/unread-count',
+        '/api/transactions/summary',
+    ]
+    for url in pages:
+        client.get(url)
+
+    # Second pages go through the keyset cursor path
+    for url in ['/transactions', '/goals', '/daily-goals', '/notifications']:
+        cursor = client.get(url, query_string={'format': 'json'}).get_json()['next_cursor']
+        if cursor:
+            client.get(url, query_string={'cursor': cursor})
+
+    with app.app_context():
+        goal_id = Goal.query.filter_by(user_id=1).first().id
+    client.get(f'/api/goals/{goal_id}/progress')
+    client.post(f'/api/notifications/1/mark-read')
+    client.post('/add-transaction', data={
+        'amount': 10, 'type': 'deposit', 'description': 'advisor',
+        'category': 'salary', 'payment_method': 'cash'
+    })
+    client.post('/add-goal', data={
+        'title': 'Advisor goal', 'target_amount': 100, 'deadline': '2030-01-01',
+        'category': 'other', 'priority': 'low'
+    })
+
+    with app.test_request_context():
+        get_monthly_summary(1)
+        get_financial_insights(1)
+        for report_type in ('weekly', 'monthly', 'yearly'):
+            generate_report(1, report_type)
+        claim_jobs('advisor', lock_timeout=300)
+        for _ in zip(range(2), pending_batches(timedelta(0), batch_size=5)):
+            pass
+        archive_notifications(retention_days=1, max_per_user=50, batch_size=20)
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='index-advisor-')
+    app = build_app(os.path.join(workdir, 'advisor.db'))
+
+    from models import db
+
+    with app.app_context():
+        db.create_all()
+        seed(db)
+        engine = db.engine
+
+    captured = {}
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and statement not in captured:
+            captured[statement] = parameters
+
+    exercise(app, app.test_client())
+    event.remove(engine, 'before_cursor_execute', record)
+
+    failures = 0
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for statement, parameters in captured.items():
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            plan = [row[-1] for row in cursor.fetchall()]
+            scans = [m.group(1) for m in map(FULL_SCAN.match, plan) if m]
+            if scans:
+                failures += 1
+                print(f"FULL SCAN of {', '.join(scans)}:")
+                print('    ' + ' '.join(statement.split()))
+                for detail in plan:
+                    print(f'    -> {detail}')
+    finally:
+        raw.close()
+
+    print(f'Checked {len(captured)} distinct queries, {failures} with full table scans')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
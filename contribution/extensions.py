@@ -1,15 +1,34 @@
+from flask import abort, current_app, redirect, url_for
 from flask_migrate import Migrate
-from flask_admin import Admin
+from flask_admin import Admin, AdminIndexView
 from flask_admin.contrib.sqla import ModelView
 from flask_login import current_user
 
 migrate = Migrate()
-admin = Admin(name='MSW', template_mode='bootstrap3')
 
-class AdminModelView(ModelView):
+def is_admin_user(user):
+    """The ADMIN_EMAIL account, once granted with `flask users grant-admin`
+
+    Signing up with ADMIN_EMAIL alone doesn't make anyone an admin.
+    """
+    return (user.is_authenticated and user.is_admin
+            and user.email.lower() == current_app.config['ADMIN_EMAIL'].lower())
+
+class AdminAccessMixin:
+    """Restricts a Flask-Admin view to the admin user"""
+    
     def is_accessible(self):
-        return current_user.is_authenticated and current_user.email == 'admin@example.com'
+        return is_admin_user(current_user)
     
     def inaccessible_callback(self, name, **kwargs):
-        from flask import redirect, url_for
+        if current_user.is_authenticated:
+            abort(403)
         return redirect(url_for('main.login'))
+
+class AdminHomeView(AdminAccessMixin, AdminIndexView):
+    pass
+
+class AdminModelView(AdminAccessMixin, ModelView):
+    pass
+
+admin = Admin(name='MSW', template_mode='bootstrap3', index_view=AdminHomeView())
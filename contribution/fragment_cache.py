@@ -0,0 +1,62 @@
+"""
+Template fragment caching
+
+    {% cache 'recent-transactions' %} ... {% endcache %}
+
+renders the block once per user, data version and day and serves it from a
+per-worker LRU cache afterwards. Any write to the user's transactions,
+goals, bank accounts, daily goals or notifications bumps the data version,
+so stale fragments are simply never looked up again. Extra arguments
+(`{% cache 'rows', cursor %}`) join the key for blocks that depend on
+request arguments. Don't cache blocks that show user profile fields or
+contain forms, since neither moves the data version.
+
+Compiled templates are also kept in a FileSystemBytecodeCache so new
+workers skip the Jinja compile step.
+"""
+
+import os
+from datetime import datetime
+
+from flask_login import current_user
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from cache import LRUCache
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        keys = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            keys.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render', [nodes.Const(parser.name), nodes.List(keys)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, template_name, keys, caller):
+        cache = self.environment.fragment_cache
+        if cache is None or not current_user.is_authenticated:
+            return caller()
+
+        key = (template_name, current_user.id, current_user.data_version,
+               datetime.utcnow().date(), *keys)
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            cache.set(key, fragment)
+        return fragment
+
+def init_app(app):
+    directory = app.config.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = LRUCache(maxsize=app.config.get('FRAGMENT_CACHE_SIZE', 4096), name='fragments')
@@ -0,0 +1,58 @@
+"""
+Gunicorn settings
+
+`gunicorn wsgi:app` reads this file from the working directory.
+
+Workers are threaded: each open live update stream (/api/events/stream)
+holds a thread for up to EVENT_STREAM_MAX_SECONDS, and with sync workers a
+couple of open tabs would leave none free for other requests. A worker
+keeps at most EVENT_STREAM_SLOTS streams open, by default GUNICORN_THREADS
+less STREAM_RESERVED_THREADS, so that many threads always remain for other
+requests; pages beyond that fall back to polling every 30 seconds. Size the
+threads for the tabs expected to be open at once: WEB_CONCURRENCY x
+EVENT_STREAM_SLOTS tabs get live updates (2 x 12 with the defaults), so
+for 200 open tabs run e.g. 4 workers with GUNICORN_THREADS=54.
+
+It also sets up prometheus_client's multiprocess mode (see metrics.py):
+every worker writes its metrics to PROMETHEUS_MULTIPROC_DIR, which is
+emptied when gunicorn starts, and a dead worker's live gauges are dropped
+when it exits.
+"""
+
+import glob
+import os
+import tempfile
+
+# prometheus_client checks this when it is imported, so it has to be set
+# here, before any worker loads the app
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'msw-prometheus'))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 4000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))  # per worker; live update streams each hold one
+
+# Threads a worker keeps free of live update streams; read by config.py
+reserved_threads = int(os.environ.get('STREAM_RESERVED_THREADS', 4))
+os.environ.setdefault('EVENT_STREAM_SLOTS', str(max(threads - reserved_threads, 1)))
+
+def on_starting(server):
+    # Samples left by a previous run would be added to this one's
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+        os.remove(path)
+
+def post_fork(server, worker):
+    # With preload_app the engines were created in the master; a worker
+    # must open its own connections rather than share the master's sockets
+    if server.cfg.preload_app:
+        from app import app
+        from models import db
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,74 @@
+"""
+Conditional GETs and compression for the JSON API
+
+@versioned views get a weak ETag derived from the URL, the user's data
+version and the current day, so a matching If-None-Match is answered with
+304 before the view runs any queries. The data version changes on every
+write to the user's transactions, goals, bank accounts, daily goals or
+notifications; the day covers summaries of the current month. JSON
+responses above COMPRESS_MIN_SIZE are gzipped for clients that accept it.
+"""
+
+import gzip
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import request, make_response, current_app
+from flask_login import current_user
+
+def _version_etag():
+    key = '|'.join((
+        request.full_path,
+        str(current_user.id),
+        str(current_user.data_version),
+        datetime.utcnow().date().isoformat()
+    ))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def _revalidate(response):
+    # Always ask before reusing, but let a 304 stand in for the body
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def versioned(view):
+    """Answer If-None-Match from the user's data version without running view"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = _version_etag()
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+            response.set_etag(etag, weak=True)
+            return _revalidate(response)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag, weak=True)
+            _revalidate(response)
+        return response
+    return wrapper
+
+def init_app(app):
+    @app.after_request
+    def compress_json(response):
+        if (response.mimetype != 'application/json'
+                or response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or not request.accept_encodings['gzip']):
+            return response
+
+        data = response.get_data()
+        if len(data) < current_app.config.get('COMPRESS_MIN_SIZE', 1024):
+            return response
+
+        response.set_data(gzip.compress(data, compresslevel=current_app.config.get('COMPRESS_LEVEL', 6)))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        # The compressed bytes differ, so a strong validator no longer applies
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
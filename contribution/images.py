@@ -0,0 +1,203 @@
+"""
+Profile image pipeline
+
+Uploads are hashed and handed to a thread pool instead of being decoded and
+resized inside the request. Each image is rendered as square JPEG and WebP
+variants for every size in PROFILE_IMAGE_SIZES, stored under its content
+hash (static/images/avatars/<hash>-<size>.<ext>), so identical uploads are
+only processed once and the files never change. They are served with
+immutable cache headers; until the variants exist, a placeholder is shown.
+
+The upload is written to disk (<hash>.orig) before the request commits and
+only queued for rendering once it has, so work lost with a dying worker is
+queued again the next time the picture is shown. If rendering fails, the
+original is dropped and the users pointing at it go back to the default
+picture.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, request, url_for
+from PIL import Image, ImageOps
+
+from models import db, User, bump_data_version
+from unit_of_work import after_commit
+
+logger = logging.getLogger(__name__)
+
+AVATAR_PREFIX = 'avatars/'
+PLACEHOLDER = 'images/avatar-placeholder.svg'
+ACCEPTED_FORMATS = ('JPEG', 'PNG')
+FORMATS = (('jpg', 'JPEG'), ('webp', 'WEBP'))
+
+def render_variants(source, directory, key, sizes, quality):
+    """Write every size/format variant of an image file; runs on the pool"""
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    # Largest last: its WebP file appearing means the whole set is written
+    for name, edge in sorted(sizes.items(), key=lambda item: item[1]):
+        variant = ImageOps.fit(image, (edge, edge), Image.LANCZOS)
+        for ext, fmt in FORMATS:
+            path = os.path.join(directory, f'{key}-{name}.{ext}')
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            variant.save(tmp_path, fmt, quality=quality, optimize=True)
+            os.replace(tmp_path, path)
+
+def _write_atomically(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class ImagePipeline:
+    def __init__(self, directory, sizes, quality=85, workers=2, on_failure=None):
+        self.directory = directory
+        self.sizes = sizes
+        self.quality = quality
+        self.on_failure = on_failure
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+        self._ready = set()
+        self._pending = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _marker(self, key):
+        largest = max(self.sizes, key=self.sizes.get)
+        return os.path.join(self.directory, f'{key}-{largest}.webp')
+
+    def is_ready(self, key):
+        if key in self._ready:
+            return True
+        if os.path.exists(self._marker(key)):
+            self._ready.add(key)
+            return True
+        return False
+
+    def _original(self, key):
+        return os.path.join(self.directory, f'{key}.orig')
+
+    def store(self, data):
+        """Save an upload for rendering and return its content key"""
+        key = hashlib.sha256(data).hexdigest()[:32]
+        if not self.is_ready(key):
+            _write_atomically(self._original(key), data)
+        return key
+
+    def render(self, key):
+        """Queue a stored upload for rendering unless it is done or underway"""
+        with self._lock:
+            if key in self._pending or self.is_ready(key) or not os.path.exists(self._original(key)):
+                return
+            future = self.executor.submit(render_variants, self._original(key), self.directory, key,
+                                          self.sizes, self.quality)
+            self._pending[key] = future
+
+        def done(future):
+            with self._lock:
+                self._pending.pop(key, None)
+            error = future.exception()
+            if error is not None:
+                logger.error('Could not process image %s: %s', key, error)
+            try:
+                os.remove(self._original(key))
+            except OSError:
+                pass
+            if error is not None and self.on_failure is not None:
+                try:
+                    self.on_failure(key)
+                except Exception:
+                    logger.exception('Could not reset users of image %s', key)
+
+        future.add_done_callback(done)
+
+    def urls(self, picture, size):
+        """{'webp': url or None, 'fallback': url} for a stored profile_picture"""
+        if picture and picture.startswith(AVATAR_PREFIX):
+            key = picture[len(AVATAR_PREFIX):]
+            if not self.is_ready(key):
+                # Queued again if a worker died before rendering it
+                self.render(key)
+            elif size in self.sizes:
+                folder = os.path.basename(self.directory)
+                return {
+                    'webp': url_for('static', filename=f'images/{folder}/{key}-{size}.webp'),
+                    'fallback': url_for('static', filename=f'images/{folder}/{key}-{size}.jpg')
+                }
+        elif picture and picture != 'default.jpg':
+            # Uploaded before the pipeline existed
+            return {'webp': None, 'fallback': url_for('static', filename='images/' + picture)}
+        return {'webp': None, 'fallback': url_for('static', filename=PLACEHOLDER)}
+
+def _reset_pictures(app, key):
+    """Point users of an image that couldn't be rendered back at the default"""
+    with app.app_context():
+        try:
+            users = User.__table__
+            connection = db.session.connection()
+            user_ids = connection.execute(
+                users.update()
+                .where(users.c.profile_picture == AVATAR_PREFIX + key)
+                .values(profile_picture='default.jpg')
+                .returning(users.c.id)
+            ).scalars().all()
+            if user_ids:
+                bump_data_version(connection, user_ids)
+            db.session.commit()
+        finally:
+            db.session.remove()
+
+def get_image_pipeline():
+    """Return the app's image pipeline, creating it on first use"""
+    app = current_app._get_current_object()
+    pipeline = app.extensions.get('image_pipeline')
+    if pipeline is None:
+        pipeline = ImagePipeline(
+            os.path.join(app.root_path, app.config['UPLOAD_FOLDER'], 'avatars'),
+            app.config.get('PROFILE_IMAGE_SIZES', {'sm': 64, 'md': 150, 'lg': 300}),
+            quality=app.config.get('PROFILE_IMAGE_QUALITY', 85),
+            workers=app.config.get('IMAGE_PIPELINE_WORKERS', 2),
+            on_failure=lambda key: _reset_pictures(app, key)
+        )
+        app.extensions['image_pipeline'] = pipeline
+    return pipeline
+
+def process_upload(file_storage):
+    """Check and store an uploaded image; returns the profile_picture value
+
+    Only the header is parsed here; raises ValueError if it isn't an image
+    we accept. Rendering is queued once the caller commits.
+    """
+    data = file_storage.read()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+    except Exception as e:
+        raise ValueError('The uploaded file is not a valid image') from e
+    if image_format not in ACCEPTED_FORMATS:
+        raise ValueError('Only JPEG and PNG images are supported')
+    pipeline = get_image_pipeline()
+    key = pipeline.store(data)
+    after_commit(pipeline.render, key)
+    return AVATAR_PREFIX + key
+
+def avatar_urls(user, size='sm'):
+    return get_image_pipeline().urls(user.profile_picture, size)
+
+def init_app(app):
+    app.jinja_env.globals['avatar_urls'] = avatar_urls
+
+    @app.after_request
+    def cache_avatars(response):
+        # Content-addressed files never change
+        if (request.endpoint == 'static' and response.status_code == 200
+                and request.view_args.get('filename', '').startswith('images/avatars/')):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = 365 * 24 * 60 * 60
+            response.cache_control.immutable = True
+        return response
@@ -0,0 +1,204 @@
+"""
+Per-request SQL and Paystack instrumentation
+
+Every statement a request runs, on any engine, is counted and timed on
+flask.g together with the time spent in Paystack calls. When the request
+ends the totals are folded into this worker's per-endpoint stats: query
+counts, DB time, the slowest statements, and statements run at least
+QUERY_REPEAT_THRESHOLD times in a single request -- the shape of an N+1.
+Admins see them at /admin/queries. With QUERY_DEBUG_HEADERS on, every
+response also carries its own numbers in X-Query-Count and Server-Timing.
+"""
+
+import heapq
+import threading
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request, current_app, redirect, url_for
+from flask_admin import BaseView, expose
+from sqlalchemy import event
+
+from extensions import admin, AdminAccessMixin
+from models import db
+from paystack_client import add_global_listener
+
+STATEMENT_LENGTH = 500
+
+def _statement_key(statement):
+    return ' '.join(statement.split())[:STATEMENT_LENGTH]
+
+class RequestStats:
+    """What one request spent in the database and in Paystack"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+        self.slowest = []  # (seconds, statement)
+        self.paystack_calls = 0
+        self.paystack_seconds = 0.0
+
+    def add_query(self, statement, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        self.statements[statement] += 1
+        self.slowest.append((seconds, statement))
+
+    def add_paystack_call(self, seconds):
+        self.paystack_calls += 1
+        self.paystack_seconds += seconds
+
+class EndpointStats:
+    """Totals for every request to one endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_seconds = 0.0
+        self.paystack_calls = 0
+        self.paystack_seconds = 0.0
+        self.slowest = []  # min-heap of (seconds, statement)
+        self.repeated = {}  # statement -> {'requests', 'max_per_request'}
+
+    def add(self, stats, seconds, repeat_threshold, keep_slowest):
+        self.requests += 1
+        self.seconds += seconds
+        self.queries += stats.queries
+        self.max_queries = max(self.max_queries, stats.queries)
+        self.db_seconds += stats.db_seconds
+        self.paystack_calls += stats.paystack_calls
+        self.paystack_seconds += stats.paystack_seconds
+
+        for seconds, statement in stats.slowest:
+            if len(self.slowest) < keep_slowest:
+                heapq.heappush(self.slowest, (seconds, statement))
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (seconds, statement))
+
+        for statement, count in stats.statements.items():
+            if count >= repeat_threshold:
+                repeated = self.repeated.setdefault(statement, {'requests': 0, 'max_per_request': 0})
+                repeated['requests'] += 1
+                repeated['max_per_request'] = max(repeated['max_per_request'], count)
+
+    def to_dict(self):
+        per_request = lambda total: total / self.requests if self.requests else 0.0  # noqa: E731
+        return {
+            'requests': self.requests,
+            'avg_ms': per_request(self.seconds) * 1000,
+            'avg_queries': per_request(self.queries),
+            'max_queries': self.max_queries,
+            'avg_db_ms': per_request(self.db_seconds) * 1000,
+            'avg_paystack_calls': per_request(self.paystack_calls),
+            'avg_paystack_ms': per_request(self.paystack_seconds) * 1000,
+            'slowest': [
+                {'ms': seconds * 1000, 'statement': statement}
+                for seconds, statement in sorted(self.slowest, reverse=True)
+            ],
+            'repeated': [
+                dict(statement=statement, **repeated)
+                for statement, repeated in sorted(self.repeated.items(), key=lambda item: -item[1]['max_per_request'])
+            ]
+        }
+
+class QueryMetrics:
+    """Per-endpoint stats for this worker process"""
+
+    def __init__(self, repeat_threshold=5, keep_slowest=10):
+        self.repeat_threshold = repeat_threshold
+        self.keep_slowest = keep_slowest
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, stats, seconds):
+        with self._lock:
+            self._endpoints.setdefault(endpoint, EndpointStats())\
+                .add(stats, seconds, self.repeat_threshold, self.keep_slowest)
+
+    def snapshot(self):
+        """Endpoint stats, most total DB time first"""
+        with self._lock:
+            endpoints = [
+                dict(endpoint=endpoint, total_db_ms=stats.db_seconds * 1000, **stats.to_dict())
+                for endpoint, stats in self._endpoints.items()
+            ]
+        return sorted(endpoints, key=lambda endpoint: -endpoint['total_db_ms'])
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+def get_query_metrics():
+    return current_app.extensions['query_metrics']
+
+def _current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, so a statement that fails can't leave a start behind
+    context._query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    if stats is not None:
+        stats.add_query(_statement_key(statement), time.perf_counter() - context._query_started)
+
+def _record_paystack_call(name, seconds, error):
+    stats = _current_stats()
+    if stats is not None:
+        stats.add_paystack_call(seconds)
+
+class QueryMetricsView(AdminAccessMixin, BaseView):
+    @expose('/')
+    def index(self):
+        metrics = get_query_metrics()
+        return self.render('admin/query_metrics.html', endpoints=metrics.snapshot(),
+                           repeat_threshold=metrics.repeat_threshold)
+
+    @expose('/reset', methods=['POST'])
+    def reset(self):
+        get_query_metrics().reset()
+        return redirect(url_for('.index'))
+
+def init_app(app):
+    """Instrument app's engines and requests; call before admin.init_app"""
+    app.extensions['query_metrics'] = QueryMetrics(
+        repeat_threshold=app.config.get('QUERY_REPEAT_THRESHOLD', 5),
+        keep_slowest=app.config.get('QUERY_SLOWEST_KEPT', 10)
+    )
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    if not any(isinstance(view, QueryMetricsView) for view in admin._views):
+        admin.add_view(QueryMetricsView(name='Queries', endpoint='queries'))
+
+    add_global_listener(_record_paystack_call)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def record_request_stats(response):
+        stats = g.pop('request_stats', None)
+        if stats is None or request.endpoint in (None, 'static'):
+            return response
+
+        elapsed = time.perf_counter() - stats.started
+        app.extensions['query_metrics'].record(request.endpoint, stats, elapsed)
+        if app.config.get('QUERY_DEBUG_HEADERS'):
+            response.headers['X-Query-Count'] = str(stats.queries)
+            response.headers['Server-Timing'] = ', '.join((
+                f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"',
+                f'paystack;dur={stats.paystack_seconds * 1000:.1f};desc="{stats.paystack_calls} calls"',
+                f'app;dur={elapsed * 1000:.1f}',
+            ))
+        return response
@@ -0,0 +1,252 @@
+"""
+Database-backed job queue
+
+Request handlers enqueue a Job in the same transaction as the rows it acts
+on, so a job exists if and only if the request's writes were committed.
+`flask jobs work` runs the queue with a fixed number of worker threads.
+Workers claim jobs with a conditional UPDATE, so any number of worker
+processes can share the queue. A job whose handler raises is retried with
+exponential backoff until max_attempts; a job whose worker died is picked
+up again once its lock is older than JOB_LOCK_TIMEOUT.
+
+Batched kinds are handed to their handler as a list. A new batched job
+waits out the batch window before it becomes runnable, and whoever claims
+it takes every other queued job of that kind along with it, up to the batch
+size; a kind with a full batch queued runs straight away.
+"""
+
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from metrics import JOB_DURATION
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+class JobError(Exception):
+    """Raised by a handler to fail the current attempt; the job is retried"""
+
+_handlers = {}
+_batches = {}
+
+def job_handler(kind, on_failure=None, batch_size=None, batch_window=None):
+    """Register fn(job) as the handler for kind
+
+    on_failure(job, error) runs when the job has used up its attempts. The
+    handler's writes and the job's completion are committed together, so
+    handlers must not commit themselves.
+
+    With batch_size and batch_window (names of config settings) the handler
+    is called as fn(jobs) with up to batch_size jobs at a time. It fails
+    single jobs by returning {job_id: error}; the rest are completed. If it
+    raises, every job in the batch fails the attempt.
+    """
+    def decorator(fn):
+        _handlers[kind] = (fn, on_failure)
+        if batch_size is not None:
+            _batches[kind] = (batch_size, batch_window)
+        return fn
+    return decorator
+
+def _batch_settings(kind):
+    """(size, window seconds) for a batched kind, or None"""
+    settings = _batches.get(kind)
+    if settings is None:
+        return None
+    size_key, window_key = settings
+    size = current_app.config.get(size_key, 1)
+    window = current_app.config.get(window_key, 0) if window_key else 0
+    return (size, window) if size > 1 else None
+
+def enqueue(kind, payload=None, run_at=None, max_attempts=None):
+    """Add a job to the session; it is queued when the caller commits"""
+    if run_at is None:
+        batch = _batch_settings(kind)
+        run_at = datetime.utcnow() + timedelta(seconds=batch[1] if batch else 0)
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload) if payload is not None else None,
+        status='queued',
+        run_at=run_at,
+        max_attempts=max_attempts or current_app.config.get('JOB_MAX_ATTEMPTS', 5)
+    )
+    db.session.add(job)
+    return job
+
+def claim_jobs(worker_id, lock_timeout):
+    """Lock the next runnable job (or batch) for worker_id; returns a list"""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=lock_timeout)
+    claimable = db.or_(
+        db.and_(Job.status == 'queued', Job.run_at <= now),
+        db.and_(Job.status == 'running', Job.locked_at < stale)
+    )
+
+    # A full batch doesn't wait for its window. Jobs backing off after a
+    # failed attempt neither count towards it nor join one until they're due.
+    batchable = db.and_(Job.status == 'queued', db.or_(Job.run_at <= now, Job.attempts == 0))
+    full_kinds = []
+    for kind in _batches:
+        batch = _batch_settings(kind)
+        if batch is not None:
+            queued = db.session.query(db.func.count(Job.id))\
+                .filter(batchable, Job.kind == kind).scalar()
+            if queued >= batch[0]:
+                full_kinds.append(kind)
+    if full_kinds:
+        claimable = db.or_(claimable, db.and_(batchable, Job.kind.in_(full_kinds)))
+
+    claim = dict(status='running', locked_at=now, locked_by=worker_id, attempts=Job.attempts + 1)
+    candidates = db.session.query(Job.id, Job.kind).filter(claimable)\
+        .order_by(Job.run_at.asc()).limit(10).all()
+    for job_id, kind in candidates:
+        claimed = db.session.execute(
+            db.update(Job).where(Job.id == job_id, claimable).values(**claim)
+        ).rowcount
+        if not claimed:
+            continue
+
+        job_ids = [job_id]
+        batch = _batch_settings(kind)
+        if batch is not None:
+            companions = db.session.query(Job.id)\
+                .filter(batchable, Job.kind == kind, Job.id != job_id)\
+                .order_by(Job.run_at.asc()).limit(batch[0] - 1).subquery()
+            job_ids += db.session.execute(
+                db.update(Job)
+                .where(Job.id.in_(db.select(companions.c.id)), batchable)
+                .values(**claim)
+                .returning(Job.id)
+            ).scalars().all()
+
+        db.session.commit()
+        jobs = Job.query.filter(Job.id.in_(job_ids)).order_by(Job.id).all()
+        return jobs
+
+    db.session.rollback()
+    return []
+
+def _retry_delay(attempts):
+    backoff = current_app.config.get('JOB_RETRY_BACKOFF', 30)
+    return timedelta(seconds=min(backoff * 2 ** (attempts - 1), 3600))
+
+def run_jobs(jobs):
+    """Run a claimed job or batch and record the outcome; returns failed attempts"""
+    kind = jobs[0].kind
+    job_ids = [job.id for job in jobs]
+    handler, on_failure = _handlers.get(kind, (None, None))
+    started = time.perf_counter()
+    try:
+        if handler is None:
+            raise JobError(f'No handler registered for {kind!r} jobs')
+        if kind in _batches:
+            failures = dict(handler(jobs) or {})
+        else:
+            handler(jobs[0])
+            failures = {}
+        for job in jobs:
+            if job.id in failures:
+                continue
+            job.status = 'done'
+            job.finished_at = datetime.utcnow()
+            job.last_error = None
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        if not isinstance(e, JobError):
+            logger.exception('Job(s) %s (%s) raised', job_ids, kind)
+        failures = dict.fromkeys(job_ids, e)
+    else:
+        for job_id, error in failures.items():
+            if not isinstance(error, JobError):
+                logger.error('Job %s (%s) raised', job_id, kind, exc_info=error)
+    JOB_DURATION.labels(kind, 'failed' if failures else 'done').observe(time.perf_counter() - started)
+
+    for job_id, error in failures.items():
+        _record_failure(job_id, error, on_failure)
+    return len(failures)
+
+def _record_failure(job_id, error, on_failure):
+    job = db.session.get(Job, job_id)
+    job.last_error = str(error)
+    if job.attempts < job.max_attempts:
+        job.status = 'queued'
+        job.run_at = datetime.utcnow() + _retry_delay(job.attempts)
+        job.locked_at = None
+        job.locked_by = None
+        db.session.commit()
+        return
+
+    if on_failure is not None:
+        try:
+            on_failure(job, error)
+        except Exception:
+            logger.exception('Failure handler for job %s (%s) raised', job_id, job.kind)
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            job.last_error = str(error)
+    job.status = 'failed'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+class Worker:
+    """Runs queued jobs on a fixed number of threads until stopped"""
+
+    def __init__(self, app, concurrency=4, poll_interval=1.0, lock_timeout=300):
+        self.app = app
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def _loop(self, burst):
+        with self.app.app_context():
+            try:
+                while not self.stopping.is_set():
+                    jobs = claim_jobs(self.worker_id, self.lock_timeout)
+                    if not jobs:
+                        if burst:
+                            return
+                        self.stopping.wait(self.poll_interval)
+                        continue
+                    failed = run_jobs(jobs)
+                    with self._lock:
+                        self.processed += len(jobs)
+                        self.failed += failed
+            finally:
+                db.session.remove()
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def run(self, burst=False):
+        """Process jobs; with burst, return once the queue is empty"""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+
+        threads = [
+            threading.Thread(target=self._loop, args=(burst,), name=f'job-worker-{i}', daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
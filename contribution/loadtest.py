@@ -0,0 +1,467 @@
+"""
+Synthetic data and load testing
+
+`flask loadtest seed` fills the configured database with users and their
+transactions, goals, daily goals, notifications and bank accounts. Rows go
+in with bulk inserts, one commit per batch of users, and the balances,
+unread counters and rollups the mapper events would maintain are computed
+alongside, so millions of rows load in minutes. Every seeded user signs in
+as <prefix><n>@example.com with the password "password".
+
+`flask loadtest stub` serves a local stand-in for the Paystack API; start
+the app under test with PAYSTACK_BASE_URL pointing at it.
+
+`flask loadtest run` drives a running app with concurrent virtual users
+that sign in, load the dashboard, page through transactions, poll the JSON
+APIs and make deposits and withdrawals, then reports p50/p95/p99 latency
+and throughput per endpoint. --output saves the report as JSON so runs on
+different commits can be compared.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+from werkzeug.security import generate_password_hash
+
+from models import (db, User, Transaction, Goal, DailyGoal, Notification, BankAccount, TransactionRollup,
+                    ledger_delta, ROLLUP_PERIODS, rollup_period_start, rollup_increments)
+
+SEED_PASSWORD = 'password'
+CATEGORIES = {
+    'deposit': ('salary', 'gift', 'business', 'savings'),
+    'withdrawal': ('bills', 'food', 'transport', 'rent'),
+}
+PAYMENT_METHODS = ('bank_transfer', 'card', 'cash')
+GOAL_CATEGORIES = ('emergency', 'vacation', 'car', 'house', 'education', 'business', 'wedding', 'other')
+INSERT_CHUNK = 10000
+
+# Seeding
+
+def _insert(model, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(db.insert(model), rows[start:start + INSERT_CHUNK])
+
+def _user_history(rng, index, scale, now):
+    """Generate one user's rows, without user ids, plus the derived counters"""
+    history_seconds = scale['history_days'] * 24 * 60 * 60
+    transactions = []
+    balance = 0.0
+    for i in range(scale['transactions']):
+        type = 'deposit' if rng.random() < 0.7 else 'withdrawal'
+        roll = rng.random()
+        status = 'completed' if roll < 0.9 else 'pending' if roll < 0.95 else 'failed'
+        created = now - timedelta(seconds=rng.randrange(history_seconds))
+        amount = round(rng.uniform(100, 50000), 2)
+        balance += ledger_delta(type, amount, status)
+        transactions.append({
+            'amount': amount,
+            'type': type,
+            'description': f'Seeded {type}',
+            'category': rng.choice(CATEGORIES[type]),
+            # Pending gateway payments are what the reconciler and webhooks act on
+            'payment_method': 'paystack' if status == 'pending' else rng.choice(PAYMENT_METHODS),
+            'reference': f'SEED-{index}-{i}',
+            'status': status,
+            'created_at': created,
+            'completed_at': created if status == 'completed' else None
+        })
+
+    goals = []
+    for i in range(scale['goals']):
+        target = rng.choice((50000, 100000, 250000, 1000000))
+        created = now - timedelta(seconds=rng.randrange(history_seconds))
+        goals.append({
+            'title': f'Goal {i + 1}',
+            'description': 'Seeded goal',
+            'target_amount': target,
+            'current_amount': round(target * rng.random(), 2),
+            'deadline': now + timedelta(days=rng.randrange(30, 730)),
+            'status': 'completed' if rng.random() < 0.2 else 'active',
+            'category': rng.choice(GOAL_CATEGORIES),
+            'priority': rng.choice(('low', 'medium', 'high')),
+            'created_at': created,
+            'updated_at': created
+        })
+
+    daily_goals = [{
+        'amount': rng.choice((500, 1000, 2000, 5000)),
+        'description': 'Seeded daily goal',
+        'date': (now - timedelta(days=i)).date(),
+        'is_completed': rng.random() < 0.6,
+        'created_at': now - timedelta(days=i)
+    } for i in range(scale['daily_goals'])]
+
+    notifications = []
+    unread = 0
+    for i in range(scale['notifications']):
+        is_read = rng.random() < 0.8
+        unread += not is_read
+        notifications.append({
+            'title': 'Seeded notification',
+            'message': f'Notification {i + 1}',
+            'type': rng.choice(('info', 'success', 'warning')),
+            'is_read': is_read,
+            'created_at': now - timedelta(seconds=rng.randrange(history_seconds))
+        })
+
+    bank_accounts = [{
+        'bank_name': 'Guaranty Trust Bank',
+        'account_number': f'{rng.randrange(10 ** 10):010d}',
+        'account_name': f'Load Test {index}',
+        'bank_code': '058',
+        'is_verified': True,
+        'is_default': i == 0,
+        'created_at': now
+    } for i in range(scale['bank_accounts'])]
+
+    return {
+        'balance': round(balance, 2),
+        'unread': unread,
+        Transaction: transactions,
+        Goal: goals,
+        DailyGoal: daily_goals,
+        Notification: notifications,
+        BankAccount: bank_accounts,
+    }
+
+def _rollup_rows(user_id, transactions):
+    rows = {}
+    for transaction in transactions:
+        increments = rollup_increments(transaction['type'], transaction['amount'])
+        if transaction['status'] != 'completed' or increments is None:
+            continue
+        for period in ROLLUP_PERIODS:
+            key = (period, rollup_period_start(period, transaction['created_at']), transaction['category'])
+            row = rows.setdefault(key, {
+                'user_id': user_id, 'period': key[0], 'period_start': key[1], 'category': key[2],
+                'deposits': 0.0, 'withdrawals': 0.0, 'deposit_count': 0, 'withdrawal_count': 0
+            })
+            for column, value in increments.items():
+                row[column] += value
+    return list(rows.values())
+
+def seed(users, transactions=500, goals=5, daily_goals=30, notifications=50, bank_accounts=1,
+         history_days=365, batch_size=200, prefix='loadtest', random_seed=0, progress=None):
+    """Insert users with generated history; returns row counts per table"""
+    scale = {
+        'transactions': transactions, 'goals': goals, 'daily_goals': daily_goals,
+        'notifications': notifications, 'bank_accounts': bank_accounts, 'history_days': history_days
+    }
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    # One hash for everybody; hashing per user would dominate the run
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    first = db.session.query(db.func.count(User.id)).filter(User.username.like(f'{prefix}%')).scalar()
+    counts = defaultdict(int)
+
+    for batch_start in range(first, first + users, batch_size):
+        indexes = range(batch_start, min(batch_start + batch_size, first + users))
+        histories = [_user_history(rng, index, scale, now) for index in indexes]
+        user_ids = db.session.scalars(
+            db.insert(User).returning(User.id, sort_by_parameter_order=True),
+            [{
+                'username': f'{prefix}{index}',
+                'email': f'{prefix}{index}@example.com',
+                'password_hash': password_hash,
+                'first_name': 'Load',
+                'last_name': f'Test {index}',
+                'created_at': now,
+                'is_verified': True,
+                'balance': history['balance'],
+                'unread_notification_count': history['unread'],
+                'data_version': 0
+            } for index, history in zip(indexes, histories)]
+        ).all()
+        counts[User] += len(user_ids)
+
+        for model in (Transaction, Goal, DailyGoal, Notification, BankAccount):
+            rows = [dict(row, user_id=user_id) for user_id, history in zip(user_ids, histories)
+                    for row in history[model]]
+            _insert(model, rows)
+            counts[model] += len(rows)
+        rollups = [row for user_id, history in zip(user_ids, histories)
+                   for row in _rollup_rows(user_id, history[Transaction])]
+        _insert(TransactionRollup, rollups)
+        counts[TransactionRollup] += len(rollups)
+
+        db.session.commit()
+        if progress is not None:
+            progress(counts[User])
+
+    return {model.__tablename__: count for model, count in counts.items()}
+
+# Paystack stub
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, data, status=True, message='Stub response', http_status=200):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = json.dumps({'status': status, 'message': message, 'data': data}).encode()
+        self.send_response(http_status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/bank':
+            return self._reply([
+                {'name': 'Access Bank', 'code': '044'},
+                {'name': 'Guaranty Trust Bank', 'code': '058'},
+                {'name': 'Zenith Bank', 'code': '057'},
+            ])
+        if path == '/bank/resolve':
+            return self._reply({'account_name': 'LOAD TEST', 'account_number': '0000000000'})
+        if path.startswith('/transaction/verify/'):
+            return self._reply({'status': 'success', 'reference': path.rsplit('/', 1)[1]})
+        if path.startswith('/transfer/verify/'):
+            # Like Paystack, only transfers it was asked to make can be verified
+            reference = path.rsplit('/', 1)[1]
+            if not self.server.has_transfer(reference):
+                return self._reply(None, status=False, message='Transfer not found', http_status=404)
+            return self._reply({'status': 'success', 'reference': reference})
+        self._reply(None, status=False, message=f'Unknown endpoint {path}')
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if path == '/transaction/initialize':
+            reference = payload.get('reference')
+            return self._reply({
+                'reference': reference,
+                'access_code': reference,
+                'authorization_url': f'http://{self.headers.get("Host")}/pay/{reference}'
+            })
+        if path == '/transferrecipient':
+            return self._reply({'recipient_code': f"RCP_{payload.get('account_number')}"})
+        if path == '/transfer':
+            self.server.add_transfers([payload.get('reference')])
+            return self._reply({'status': 'pending', 'reference': payload.get('reference'),
+                                'transfer_code': f"TRF_{payload.get('reference')}"})
+        if path == '/transfer/bulk':
+            self.server.add_transfers([transfer['reference'] for transfer in payload.get('transfers', [])])
+            return self._reply([
+                {'reference': transfer['reference'], 'status': 'pending',
+                 'transfer_code': f"TRF_{transfer['reference']}"}
+                for transfer in payload.get('transfers', [])
+            ])
+        self._reply(None, status=False, message=f'Unknown endpoint {path}')
+
+class PaystackStub(ThreadingHTTPServer):
+    """Answers the Paystack calls the app makes; every payment succeeds"""
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0):
+        super().__init__(address, _StubHandler)
+        self.latency = latency
+        self._transfers = set()
+        self._lock = threading.Lock()
+
+    def add_transfers(self, references):
+        with self._lock:
+            self._transfers.update(references)
+
+    def has_transfer(self, reference):
+        with self._lock:
+            return reference in self._transfers
+
+# Load scenario
+
+CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+BANK_ACCOUNT_OPTION = re.compile(r'<select[^>]*name="bank_account_id"[^>]*>\s*<option[^>]*value="(\d+)"')
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(int(round(pct / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+class LoadReport:
+    """Latencies per endpoint, recorded from many threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def _summary(self, latencies, errors, elapsed):
+        ordered = sorted(latencies)
+        ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None  # noqa: E731
+        return {
+            'requests': len(ordered),
+            'errors': errors,
+            'throughput': round(len(ordered) / elapsed, 2) if elapsed else None,
+            'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else None,
+            'p50_ms': ms(percentile(ordered, 50)),
+            'p95_ms': ms(percentile(ordered, 95)),
+            'p99_ms': ms(percentile(ordered, 99)),
+            'max_ms': ms(ordered[-1]) if ordered else None
+        }
+
+    def to_dict(self, elapsed):
+        with self._lock:
+            endpoints = {
+                name: self._summary(latencies, self.errors[name], elapsed)
+                for name, latencies in sorted(self.latencies.items())
+            }
+            everything = [seconds for latencies in self.latencies.values() for seconds in latencies]
+            total = self._summary(everything, sum(self.errors.values()), elapsed)
+        return {'elapsed_seconds': round(elapsed, 2), 'total': total, 'endpoints': endpoints}
+
+def _reports_error(response):
+    """Whether a JSON response says {'status': 'error'}, as /deposit and /withdraw do with a 200"""
+    if 'json' not in response.headers.get('Content-Type', ''):
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and body.get('status') == 'error'
+
+class VirtualUser:
+    """One signed-in browser session running the scenario"""
+
+    def __init__(self, base_url, email, report, rng, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.email = email
+        self.report = report
+        self.rng = rng
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.bank_account_id = None
+
+    def call(self, name, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, timeout=self.timeout,
+                                         allow_redirects=False, **kwargs)
+        except requests.RequestException:
+            response = None
+        self.report.record(name, time.perf_counter() - start,
+                           response is not None and response.status_code < 400 and not _reports_error(response))
+        return response
+
+    def _json(self, response):
+        if response is None or response.status_code != 200:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def login(self):
+        page = self.call('GET /login', 'GET', '/login')
+        token = CSRF_TOKEN.search(page.text) if page is not None else None
+        response = self.call('POST /login', 'POST', '/login', data={
+            'email': self.email,
+            'password': SEED_PASSWORD,
+            'csrf_token': token.group(1) if token else ''
+        })
+        return response is not None and response.status_code == 302
+
+    def browse(self):
+        self.call('GET /dashboard', 'GET', '/dashboard')
+        listing = self._json(self.call('GET /transactions (json)', 'GET', '/transactions', params={'format': 'json'}))
+        if listing and listing.get('next_cursor'):
+            self.call('GET /transactions?cursor', 'GET', '/transactions', params={'cursor': listing['next_cursor']})
+        self.call('GET /api/notifications/unread-count', 'GET', '/api/notifications/unread-count')
+        self.call('GET /api/transactions/summary', 'GET', '/api/transactions/summary')
+        goals = self._json(self.call('GET /goals (json)', 'GET', '/goals', params={'format': 'json'}))
+        if goals and goals.get('items'):
+            goal_id = self.rng.choice(goals['items'])['id']
+            self.call('GET /api/goals/<id>/progress', 'GET', f'/api/goals/{goal_id}/progress')
+
+    def deposit(self):
+        page = self.call('GET /deposit', 'GET', '/deposit')
+        if page is None or page.status_code != 200:
+            return
+        token = CSRF_TOKEN.search(page.text)
+        account = BANK_ACCOUNT_OPTION.search(page.text)
+        if not account:
+            return
+        self.bank_account_id = account.group(1)
+        result = self._json(self.call('POST /deposit', 'POST', '/deposit', data={
+            'amount': self.rng.randrange(1000, 20000),
+            'category': 'deposit',
+            'bank_account_id': self.bank_account_id,
+            'csrf_token': token.group(1) if token else ''
+        }))
+        if result and result.get('authorization_url'):
+            # The stub puts the reference at the end of the authorization URL
+            reference = result['authorization_url'].rsplit('/', 1)[-1]
+            self.call('POST /api/verify-payment/<reference>', 'POST', f'/api/verify-payment/{reference}')
+
+    def withdraw(self):
+        if self.bank_account_id is None:
+            return
+        result = self._json(self.call('POST /withdraw', 'POST', '/withdraw', data={
+            'amount': self.rng.randrange(100, 1000),
+            'bank_account_id': self.bank_account_id
+        }))
+        if result and result.get('transfer_reference'):
+            self.call('GET /api/transfer-status/<reference>', 'GET',
+                      f"/api/transfer-status/{result['transfer_reference']}")
+
+    def run(self, deadline, deposit_ratio, withdraw_ratio, think_time):
+        if not self.login():
+            return
+        while time.monotonic() < deadline:
+            self.browse()
+            if self.rng.random() < deposit_ratio:
+                self.deposit()
+            if self.rng.random() < withdraw_ratio:
+                self.withdraw()
+            if think_time:
+                time.sleep(self.rng.uniform(0, 2 * think_time))
+
+def run_load(base_url, users=10, duration=60, accounts=None, prefix='loadtest', deposit_ratio=0.1,
+             withdraw_ratio=0.05, think_time=0.0, random_seed=0):
+    """Run the scenario with users concurrent virtual users; returns the report dict
+
+    Virtual user i signs in as seeded account i modulo accounts.
+    """
+    report = LoadReport()
+    accounts = accounts or users
+    deadline = time.monotonic() + duration
+    virtual_users = [
+        VirtualUser(base_url, f'{prefix}{i % accounts}@example.com', report, random.Random(random_seed + i))
+        for i in range(users)
+    ]
+    threads = [
+        threading.Thread(target=user.run, args=(deadline, deposit_ratio, withdraw_ratio, think_time), daemon=True)
+        for user in virtual_users
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = report.to_dict(time.monotonic() - started)
+    result['settings'] = {
+        'base_url': base_url, 'users': users, 'duration': duration, 'accounts': accounts,
+        'deposit_ratio': deposit_ratio, 'withdraw_ratio': withdraw_ratio, 'think_time': think_time
+    }
+    return result
@@ -0,0 +1,152 @@
+"""
+Prometheus metrics
+
+/metrics serves, in the Prometheus text format:
+
+- request latency per endpoint, method and status code
+- Paystack call latency and errors per call (the functions in
+  utils_paystack_transfer.py name their calls after themselves)
+- connections checked out of each database pool against its capacity
+- hits and misses of the in-process caches
+- job queue depth and lag per kind, and job run times and outcomes
+
+Under gunicorn each worker keeps its own counters, so the app runs in
+prometheus_client's multiprocess mode: gunicorn.conf.py points
+PROMETHEUS_MULTIPROC_DIR at a shared directory before any worker starts,
+every process writes its samples there, and whichever worker answers the
+scrape sums them. Run `flask jobs work` with the same directory to include
+the job workers' numbers. Queue depth and lag are read from the database at
+scrape time, so they are reported once rather than per process.
+
+PROMETHEUS_MULTIPROC_DIR must be set before prometheus_client is imported.
+
+The endpoint exposes per-route traffic and queue internals, so scrapes must
+send 'Authorization: Bearer <METRICS_TOKEN>'. Without METRICS_TOKEN set,
+/metrics answers 404.
+"""
+
+import hmac
+import os
+import time
+from datetime import datetime
+
+from flask import abort, current_app, g, request, Response
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from models import db, Job
+from paystack_client import add_global_listener
+
+REQUEST_LATENCY = Histogram(
+    'msw_request_duration_seconds', 'Time to handle a request',
+    ['endpoint', 'method', 'status']
+)
+PAYSTACK_LATENCY = Histogram(
+    'msw_paystack_request_duration_seconds', 'Time spent in a Paystack call, retries included',
+    ['call'], buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 20, 30)
+)
+PAYSTACK_ERRORS = Counter(
+    'msw_paystack_errors_total', 'Paystack calls that failed on the network or with a 5xx',
+    ['call']
+)
+DB_POOL_IN_USE = Gauge(
+    'msw_db_pool_connections_in_use', 'Connections checked out of the pool, overflow included',
+    ['engine'], multiprocess_mode='livesum'
+)
+DB_POOL_CAPACITY = Gauge(
+    'msw_db_pool_capacity', 'Connections the pool can hand out, overflow included',
+    ['engine'], multiprocess_mode='livesum'
+)
+CACHE_LOOKUPS = Counter(
+    'msw_cache_lookups_total', 'In-process cache lookups',
+    ['cache', 'result']
+)
+JOB_DURATION = Histogram(
+    'msw_job_duration_seconds', 'Time to run a job or batch of jobs',
+    ['kind', 'outcome'], buckets=(.1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+def multiprocess_enabled():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+def record_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+def _record_paystack_call(name, seconds, error):
+    PAYSTACK_LATENCY.labels(name).observe(seconds)
+    if error:
+        PAYSTACK_ERRORS.labels(name).inc()
+
+class JobQueueCollector:
+    """Queue depth and lag, read from the jobs table when scraped"""
+
+    def collect(self):
+        now = datetime.utcnow()
+        depth = GaugeMetricFamily('msw_job_queue_depth', 'Jobs waiting or running', labels=['kind', 'status'])
+        for kind, status, count in db.session.query(Job.kind, Job.status, db.func.count(Job.id))\
+                .filter(Job.status.in_(('queued', 'running'))).group_by(Job.kind, Job.status):
+            depth.add_metric([kind, status], count)
+
+        lag = GaugeMetricFamily('msw_job_queue_lag_seconds',
+                                'How long the oldest runnable queued job has been due', labels=['kind'])
+        for kind, oldest in db.session.query(Job.kind, db.func.min(Job.run_at))\
+                .filter(Job.status == 'queued', Job.run_at <= now).group_by(Job.kind):
+            lag.add_metric([kind], (now - oldest).total_seconds())
+        return [depth, lag]
+
+def render_metrics():
+    """Every process's metrics plus the queue gauges, in the text format"""
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(current_app.extensions['job_queue_metrics'])
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(403)
+    return Response(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+def _instrument_pool(name, engine):
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            DB_POOL_CAPACITY.labels(name).set(pool.size() + max(pool._max_overflow, 0))
+        DB_POOL_IN_USE.labels(name).inc()
+
+    def checkin(dbapi_connection, connection_record):
+        DB_POOL_IN_USE.labels(name).dec()
+
+    event.listen(engine, 'checkout', checkout)
+    event.listen(engine, 'checkin', checkin)
+
+def init_app(app):
+    job_queue = CollectorRegistry()
+    job_queue.register(JobQueueCollector())
+    app.extensions['job_queue_metrics'] = job_queue
+
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            _instrument_pool(bind or 'primary', engine)
+    add_global_listener(_record_paystack_call)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_latency(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            REQUEST_LATENCY.labels(request.endpoint or 'unmatched', request.method, response.status_code)\
+                .observe(time.perf_counter() - started)
+        return response
@@ -1,10 +1,26 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from itertools import chain
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import json
 
-db = SQLAlchemy()
+class RoutingSession(FlaskSession):
+    """Reads from the 'replica' bind while info['use_replica'] is set (see replicas.py)"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get('use_replica') and not self._flushing
+                and not getattr(clause, 'is_dml', False)):
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -17,6 +33,10 @@ class User(UserMixin, db.Model):
     profile_picture = db.Column(db.String(255), default='default.jpg')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_verified = db.Column(db.Boolean, default=False)
+    balance = db.Column(db.Float, nullable=False, default=0.0, server_default='0')  # maintained by the transaction ledger
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # bumped on every write to the user's data
+    unread_notification_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # maintained by notification events
+    is_admin = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())  # set by `flask users grant-admin`
     
     # Relationships
     transactions = db.relationship('Transaction', backref='user', lazy='dynamic')
@@ -30,13 +50,7 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
     
     def get_total_savings(self):
-        total = 0
-        for transaction in self.transactions:
-            if transaction.type == 'deposit':
-                total += transaction.amount
-            elif transaction.type == 'withdrawal':
-                total -= transaction.amount
-        return total
+        return self.balance or 0.0
     
     def get_total_goals(self):
         return self.goals.count()
@@ -45,18 +59,36 @@ class User(UserMixin, db.Model):
         return self.goals.filter_by(status='completed').count()
 
 class Transaction(db.Model):
+    __table_args__ = (
+        db.Index('ix_transaction_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_transaction_user_status_created', 'user_id', 'status', 'created_at'),
+        db.Index('ix_transaction_status_created', 'status', 'created_at', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     type = db.Column(db.String(20), nullable=False)  # deposit, withdrawal, transfer
     description = db.Column(db.String(500))
     category = db.Column(db.String(50))  # salary, gift, bills, food, transport, etc.
-    payment_method = db.Column(db.String(50))  # bank_transfer, card, cash
+    payment_method = db.Column(db.String(50))  # bank_transfer, card, cash; paystack (or NULL on old rows) for gateway payments
     reference = db.Column(db.String(100), unique=True)
-    status = db.Column(db.String(20), default='pending')  # pending, completed, failed
+    # active_history so the balance ledger always sees the previous status
+    status = db.column_property(db.Column(db.String(20), default='pending'), active_history=True)  # pending, completed, failed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
     
+    def balance_delta(self):
+        """Signed effect of this transaction on the owner's balance"""
+        return ledger_delta(self.type, self.amount, self.status)
+    
+    def mark_completed(self):
+        self.status = 'completed'
+        self.completed_at = datetime.utcnow()
+    
+    def mark_failed(self):
+        self.status = 'failed'
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -70,6 +102,11 @@ class Transaction(db.Model):
         }
 
 class Goal(db.Model):
+    __table_args__ = (
+        db.Index('ix_goal_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_goal_user_status_deadline', 'user_id', 'status', 'deadline'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
@@ -111,6 +148,10 @@ class Goal(db.Model):
         }
 
 class BankAccount(db.Model):
+    __table_args__ = (
+        db.Index('ix_bank_account_user_account', 'user_id', 'account_number'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     bank_name = db.Column(db.String(100), nullable=False)
@@ -134,6 +175,10 @@ class BankAccount(db.Model):
         }
 
 class DailyGoal(db.Model):
+    __table_args__ = (
+        db.Index('ix_daily_goal_user_date', 'user_id', 'date', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
@@ -152,12 +197,18 @@ class DailyGoal(db.Model):
         }
 
 class Notification(db.Model):
+    __table_args__ = (
+        db.Index('ix_notification_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_notification_user_read', 'user_id', 'is_read'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
     message = db.Column(db.Text, nullable=False)
     type = db.Column(db.String(20), default='info')  # info, success, warning, error
-    is_read = db.Column(db.Boolean, default=False)
+    # active_history so the unread counter always sees the previous value
+    is_read = db.column_property(db.Column(db.Boolean, default=False), active_history=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
@@ -169,3 +220,418 @@ class Notification(db.Model):
             'is_read': self.is_read,
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
         }
+
+class NotificationArchive(db.Model):
+    """Notifications moved out of the hot table by `flask notifications archive`"""
+    __table_args__ = (
+        db.Index('ix_notification_archive_user_created', 'user_id', 'created_at', 'id'),
+    )    
+    id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, nullable=False)  # id the row had in the notification table
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    type = db.Column(db.String(20))
+    is_read = db.Column(db.Boolean)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class TransactionRollup(db.Model):
+    """Per-user daily and monthly totals of completed transactions"""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', 'period_start', 'category', name='uq_transaction_rollup_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    period = db.Column(db.String(10), nullable=False)  # day, month
+    period_start = db.Column(db.Date, nullable=False)
+    category = db.Column(db.String(50), nullable=False, default='')
+    deposits = db.Column(db.Float, nullable=False, default=0.0)
+    withdrawals = db.Column(db.Float, nullable=False, default=0.0)
+    deposit_count = db.Column(db.Integer, nullable=False, default=0)
+    withdrawal_count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserEvent(db.Model):
+    """Change events for a user, tailed by the live update stream"""
+    __table_args__ = (
+        db.Index('ix_user_event_user_id', 'user_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)  # notifications, balance, transfer
+    payload = db.Column(db.Text)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'payload': json.loads(self.payload) if self.payload else {}
+        }
+
+class Job(db.Model):
+    """Background work queued in the database, run by `flask jobs work`"""
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+        db.Index('ix_job_kind_status', 'kind', 'status', 'run_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(100))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    def get_payload(self):
+        return json.loads(self.payload) if self.payload else {}
+
+class WebhookEvent(db.Model):
+    """A signed Paystack webhook delivery, stored before it is processed"""
+    id = db.Column(db.Integer, primary_key=True)
+    event_key = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of the body, dedupes redeliveries
+    event = db.Column(db.String(50), nullable=False)  # charge.success, transfer.success, ...
+    reference = db.Column(db.String(100), index=True)
+    payload = db.Column(db.Text, nullable=False)  # raw request body
+    status = db.Column(db.String(20), nullable=False, default='received')  # received, processed, ignored
+    error = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    
+    def get_payload(self):
+        return json.loads(self.payload)
+
+# Balance ledger
+#
+# User.balance is kept in step with the transaction history by the mapper
+# events below, so every write path that inserts a Transaction or moves its
+# status updates the balance in the same database transaction. A deposit
+# counts once it is completed, so money that hasn't arrived can't be
+# withdrawn; a withdrawal counts unless it failed, so money on its way out
+# can't be spent twice.
+
+def ledger_delta(type, amount, status):
+    if type == 'deposit':
+        return amount if status == 'completed' else 0.0
+    if type == 'withdrawal':
+        return -amount if status != 'failed' else 0.0
+    return 0.0
+
+def adjust_user_balance(connection, user_id, delta):
+    """Atomically apply delta to a user's materialized balance"""
+    if not delta:
+        return
+    users = User.__table__
+    connection.execute(
+        users.update()
+        .where(users.c.id == user_id)
+        .values(balance=users.c.balance + delta)
+    )
+
+def compute_user_balances(user_id=None):
+    """Recompute balances from the transaction history, keyed by user id"""
+    # The same rule as ledger_delta
+    signed_amount = db.case(
+        (db.and_(Transaction.type == 'deposit', Transaction.status == 'completed'), Transaction.amount),
+        (db.and_(Transaction.type == 'withdrawal',
+                 db.or_(Transaction.status.is_(None), Transaction.status != 'failed')), -Transaction.amount),
+        else_=0.0
+    )
+    query = db.session.query(Transaction.user_id, db.func.sum(signed_amount))\
+        .group_by(Transaction.user_id)
+    if user_id is not None:
+        query = query.filter(Transaction.user_id == user_id)
+    return {uid: total or 0.0 for uid, total in query}
+
+@event.listens_for(Transaction, 'after_insert')
+def _ledger_after_insert(mapper, connection, target):
+    adjust_user_balance(connection, target.user_id, target.balance_delta())
+
+@event.listens_for(Transaction, 'after_update')
+def _ledger_after_update(mapper, connection, target):
+    history = inspect(target).attrs.status.history
+    if not history.deleted:
+        return
+    previous = history.deleted[0]
+    delta = target.balance_delta() - ledger_delta(target.type, target.amount, previous)
+    adjust_user_balance(connection, target.user_id, delta)
+
+@event.listens_for(Transaction, 'after_delete')
+def _ledger_after_delete(mapper, connection, target):
+    adjust_user_balance(connection, target.user_id, -target.balance_delta())
+
+
+# Transaction rollups
+#
+# TransactionRollup rows are maintained by the mapper events below whenever a
+# transaction enters or leaves the 'completed' status. Rows are bucketed by
+# the transaction's created_at, matching the period filters the summaries
+# have always used.
+
+ROLLUP_PERIODS = ('day', 'month')
+
+def rollup_period_start(period, moment):
+    day = moment.date()
+    return day.replace(day=1) if period == 'month' else day
+
+def rollup_increments(type, amount, sign=1):
+    """Column increments for one transaction, or None if it isn't rolled up"""
+    if type == 'deposit':
+        return {'deposits': sign * amount, 'deposit_count': sign}
+    if type == 'withdrawal':
+        return {'withdrawals': sign * amount, 'withdrawal_count': sign}
+    return None
+
+def _upsert_rollup(connection, key, increments):
+    table = TransactionRollup.__table__
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    values = {'deposits': 0.0, 'withdrawals': 0.0, 'deposit_count': 0, 'withdrawal_count': 0}
+    values.update(increments)
+    stmt = insert(table).values(**key, **values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'period', 'period_start', 'category'],
+        set_={column: table.c[column] + stmt.excluded[column] for column in increments}
+    )
+    connection.execute(stmt)
+
+def apply_to_rollups(connection, user_id, type, amount, category, created_at, sign=1):
+    """Add (sign=1) or remove (sign=-1) a completed transaction from the rollups"""
+    apply_batch_to_rollups(connection, [(user_id, type, amount, category, created_at)], sign)
+
+def apply_batch_to_rollups(connection, transactions, sign=1):
+    """Apply many (user_id, type, amount, category, created_at) tuples at once
+
+    Increments are summed per rollup row first, so each row is upserted once.
+    """
+    totals = {}
+    for user_id, type, amount, category, created_at in transactions:
+        increments = rollup_increments(type, amount, sign)
+        if increments is None or created_at is None:
+            continue
+        for period in ROLLUP_PERIODS:
+            key = (user_id, period, rollup_period_start(period, created_at), category or '')
+            row = totals.setdefault(key, {})
+            for column, value in increments.items():
+                row[column] = row.get(column, 0) + value
+
+    for (user_id, period, period_start, category), increments in totals.items():
+        key = {
+            'user_id': user_id,
+            'period': period,
+            'period_start': period_start,
+            'category': category
+        }
+        _upsert_rollup(connection, key, increments)
+
+def _apply_transaction_to_rollups(connection, target, sign):
+    apply_to_rollups(connection, target.user_id, target.type, target.amount,
+                     target.category, target.created_at, sign)
+
+@event.listens_for(Transaction, 'after_insert')
+def _rollups_after_insert(mapper, connection, target):
+    if target.status == 'completed':
+        _apply_transaction_to_rollups(connection, target, 1)
+
+@event.listens_for(Transaction, 'after_update')
+def _rollups_after_update(mapper, connection, target):
+    history = inspect(target).attrs.status.history
+    if not history.deleted:
+        return
+    was_completed = history.deleted[0] == 'completed'
+    is_completed = target.status == 'completed'
+    if is_completed and not was_completed:
+        _apply_transaction_to_rollups(connection, target, 1)
+    elif was_completed and not is_completed:
+        _apply_transaction_to_rollups(connection, target, -1)
+
+@event.listens_for(Transaction, 'after_delete')
+def _rollups_after_delete(mapper, connection, target):
+    if target.status == 'completed':
+        _apply_transaction_to_rollups(connection, target, -1)
+
+def compute_rollup_rows(user_ids):
+    """Aggregate the completed transactions of user_ids into rollup rows"""
+    rows = {}
+    history = db.session.query(
+        Transaction.user_id, Transaction.type, Transaction.amount,
+        Transaction.category, Transaction.created_at
+    ).filter(
+        Transaction.user_id.in_(user_ids),
+        Transaction.status == 'completed'
+    ).yield_per(5000)
+
+    for uid, type, amount, category, created_at in history:
+        increments = rollup_increments(type, amount)
+        if increments is None or created_at is None:
+            continue
+        for period in ROLLUP_PERIODS:
+            key = (uid, period, rollup_period_start(period, created_at), category or '')
+            row = rows.setdefault(key, {
+                'user_id': key[0], 'period': key[1], 'period_start': key[2], 'category': key[3],
+                'deposits': 0.0, 'withdrawals': 0.0, 'deposit_count': 0, 'withdrawal_count': 0
+            })
+            for column, value in increments.items():
+                row[column] += value
+    return list(rows.values())
+
+def rebuild_rollups(user_ids, batch_size=200):
+    """Replace the rollup rows of user_ids, committing per batch; returns rows written"""
+    written = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        TransactionRollup.query.filter(TransactionRollup.user_id.in_(batch))\
+            .delete(synchronize_session=False)
+        rows = compute_rollup_rows(batch)
+        if rows:
+            db.session.execute(db.insert(TransactionRollup), rows)
+        db.session.commit()
+        written += len(rows)
+    return written
+
+def sum_rollups(user_id, period, start, end=None):
+    """Totals over rollup rows with period_start in [start, end]
+
+    Returns the overall totals plus a per-category breakdown.
+    """
+    query = db.session.query(
+        TransactionRollup.category,
+        db.func.sum(TransactionRollup.deposits),
+        db.func.sum(TransactionRollup.withdrawals),
+        db.func.sum(TransactionRollup.deposit_count),
+        db.func.sum(TransactionRollup.withdrawal_count)
+    ).filter(
+        TransactionRollup.user_id == user_id,
+        TransactionRollup.period == period,
+        TransactionRollup.period_start >= start
+    )
+    if end is not None:
+        query = query.filter(TransactionRollup.period_start <= end)
+
+    totals = {'total_deposits': 0.0, 'total_withdrawals': 0.0, 'transaction_count': 0}
+    categories = {}
+    for category, deposits, withdrawals, deposit_count, withdrawal_count in query.group_by(TransactionRollup.category):
+        totals['total_deposits'] += deposits or 0.0
+        totals['total_withdrawals'] += withdrawals or 0.0
+        totals['transaction_count'] += (deposit_count or 0) + (withdrawal_count or 0)
+        categories[category or 'uncategorized'] = {
+            'deposits': deposits or 0.0,
+            'withdrawals': withdrawals or 0.0
+        }
+    totals['net_savings'] = totals['total_deposits'] - totals['total_withdrawals']
+    totals['categories'] = categories
+    return totals
+
+
+# Per-user data version
+#
+# User.data_version is bumped whenever a flush inserts, updates or deletes any
+# row owned by the user, in the same database transaction as the write.
+# Caches key their entries on it, so they never need explicit invalidation.
+# Bulk Query.update()/delete() calls bypass the flush and must call
+# bump_data_version themselves.
+
+USER_SCOPED_MODELS = (Transaction, Goal, BankAccount, DailyGoal, Notification)
+
+def bump_data_version(connection, user_ids):
+    """Increment the data version of every user in user_ids"""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    users = User.__table__
+    connection.execute(
+        users.update()
+        .where(users.c.id.in_(user_ids))
+        .values(data_version=users.c.data_version + 1)
+    )
+
+@event.listens_for(Session, 'after_flush')
+def _bump_versions_after_flush(session, flush_context):
+    user_ids = {
+        obj.user_id
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if isinstance(obj, USER_SCOPED_MODELS) and obj.user_id is not None
+    }
+    if user_ids:
+        bump_data_version(session.connection(), user_ids)
+
+
+# Unread notification counter
+#
+# User.unread_notification_count follows notification inserts, deletes and
+# is_read changes made through the ORM. Bulk updates must adjust it
+# themselves; reconcile_unread_counts() repairs any drift.
+
+def adjust_unread_count(connection, user_id, delta):
+    if not delta:
+        return
+    users = User.__table__
+    connection.execute(
+        users.update()
+        .where(users.c.id == user_id)
+        .values(unread_notification_count=users.c.unread_notification_count + delta)
+    )
+
+def reset_unread_count(connection, user_id):
+    users = User.__table__
+    connection.execute(
+        users.update()
+        .where(users.c.id == user_id)
+        .values(unread_notification_count=0)
+    )
+
+@event.listens_for(Notification, 'after_insert')
+def _unread_after_insert(mapper, connection, target):
+    if not target.is_read:
+        adjust_unread_count(connection, target.user_id, 1)
+
+@event.listens_for(Notification, 'after_update')
+def _unread_after_update(mapper, connection, target):
+    history = inspect(target).attrs.is_read.history
+    if not history.deleted:
+        return
+    was_unread = not history.deleted[0]
+    is_unread = not target.is_read
+    if was_unread != is_unread:
+        adjust_unread_count(connection, target.user_id, 1 if is_unread else -1)
+
+@event.listens_for(Notification, 'after_delete')
+def _unread_after_delete(mapper, connection, target):
+    if not target.is_read:
+        adjust_unread_count(connection, target.user_id, -1)
+
+def reconcile_unread_counts():
+    """Reset drifted counters from the notification table; returns fixed user ids
+
+    Counts and writes in one UPDATE, so a notification added or read while
+    it runs can't be lost between reading the count and storing it.
+    """
+    users = User.__table__
+    notifications = Notification.__table__
+    unread = db.select(db.func.count(notifications.c.id)).where(
+        notifications.c.user_id == users.c.id,
+        db.or_(notifications.c.is_read.is_(None), notifications.c.is_read == False)  # noqa: E712
+    ).scalar_subquery()
+    connection = db.session.connection()
+    fixed = connection.execute(
+        users.update()
+        .where(users.c.unread_notification_count != unread)
+        .values(unread_notification_count=unread)
+        .returning(users.c.id)
+    ).scalars().all()
+    if fixed:
+        bump_data_version(connection, fixed)
+    db.session.commit()
+    return fixed
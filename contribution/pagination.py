@@ -0,0 +1,109 @@
+"""
+Keyset (cursor) pagination for the listing pages
+
+Pages are addressed by an opaque cursor holding the sort key of the row at
+the page boundary instead of an OFFSET, so fetching page N costs the same
+index seek as fetching page 1. Counting the full result set is optional.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from models import db
+
+class KeysetPage:
+    """One page of results plus the cursors needed to move around it"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def to_dict(self, serialize=None):
+        serialize = serialize or (lambda item: item.to_dict())
+        return {
+            'items': [serialize(item) for item in self.items],
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'total': self.total
+        }
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _decode_value(column, value):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+def encode_cursor(row, sort_column, id_column, direction):
+    key = [_encode_value(getattr(row, sort_column.key)), getattr(row, id_column.key)]
+    payload = json.dumps({'k': key, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort_column, id_column):
+    """Return ((sort_value, id), direction) or None for a missing/invalid cursor"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        sort_value, row_id = payload['k']
+        direction = payload['d']
+        if direction not in ('next', 'prev'):
+            return None
+        return (_decode_value(sort_column, sort_value), int(row_id)), direction
+    except (ValueError, TypeError, KeyError):
+        return None
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=10, with_total=False):
+    """Paginate query newest-first on (sort_column, id_column)
+
+    The query must not already be ordered. Pass with_total=True to also run
+    a COUNT over the (unpaginated) query.
+    """
+    total = query.order_by(None).count() if with_total else None
+    decoded = decode_cursor(cursor, sort_column, id_column)
+    key = db.tuple_(sort_column, id_column)
+
+    if decoded is None:
+        rows = query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1).all()
+        has_more_after, has_more_before = len(rows) > per_page, False
+        items = rows[:per_page]
+    else:
+        boundary, direction = decoded
+        if direction == 'next':
+            rows = query.filter(key < boundary)\
+                .order_by(sort_column.desc(), id_column.desc())\
+                .limit(per_page + 1).all()
+            has_more_after, has_more_before = len(rows) > per_page, True
+            items = rows[:per_page]
+        else:
+            rows = query.filter(key > boundary)\
+                .order_by(sort_column.asc(), id_column.asc())\
+                .limit(per_page + 1).all()
+            has_more_after, has_more_before = True, len(rows) > per_page
+            items = list(reversed(rows[:per_page]))
+
+    next_cursor = prev_cursor = None
+    if items and has_more_after:
+        next_cursor = encode_cursor(items[-1], sort_column, id_column, 'next')
+    if items and has_more_before:
+        prev_cursor = encode_cursor(items[0], sort_column, id_column, 'prev')
+
+    return KeysetPage(items, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total)
@@ -0,0 +1,191 @@
+"""
+Shared Paystack HTTP client
+
+One pooled keep-alive session per worker process, with connect/read
+timeouts, jittered retries for idempotent GETs and per-call latency stats.
+All Paystack traffic goes through get_paystack_client().
+"""
+
+import os
+import threading
+import time
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class PaystackError(Exception):
+    """Raised when a Paystack call fails before returning a JSON body"""
+
+def to_kobo(amount):
+    """A naira amount in kobo, as Paystack takes and reports it
+
+    Rounded rather than truncated: 1.13 * 100 is 112.99999999999999.
+    """
+    return int(round(amount * 100))
+
+class CallStats:
+    """Latency and error counters for one kind of Paystack call"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, error):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if error:
+            self.errors += 1
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': (self.total_seconds / self.count) * 1000 if self.count else 0.0,
+            'max_ms': self.max_seconds * 1000
+        }
+
+class PaystackClient:
+    def __init__(self, secret_key, base_url='https://api.paystack.co',
+                 connect_timeout=3.05, read_timeout=10, pool_connections=4,
+                 pool_maxsize=16, max_retries=2, backoff_factor=0.3, backoff_jitter=0.2):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._listeners = []
+
+        # Connection errors are retried for every method (nothing was sent);
+        # read errors and retryable statuses only for idempotent GETs.
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_jitter,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry
+        )
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {secret_key}',
+            'Content-Type': 'application/json'
+        })
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            secret_key=config['PAYSTACK_SECRET_KEY'],
+            base_url=config.get('PAYSTACK_BASE_URL', 'https://api.paystack.co'),
+            connect_timeout=config.get('PAYSTACK_CONNECT_TIMEOUT', 3.05),
+            read_timeout=config.get('PAYSTACK_READ_TIMEOUT', 10),
+            pool_connections=config.get('PAYSTACK_POOL_CONNECTIONS', 4),
+            pool_maxsize=config.get('PAYSTACK_POOL_MAXSIZE', 16),
+            max_retries=config.get('PAYSTACK_MAX_RETRIES', 2),
+            backoff_factor=config.get('PAYSTACK_BACKOFF_FACTOR', 0.3),
+            backoff_jitter=config.get('PAYSTACK_BACKOFF_JITTER', 0.2)
+        )
+
+    def add_listener(self, listener):
+        """Call listener(name, seconds, error) after every request"""
+        self._listeners.append(listener)
+
+    def _record(self, name, seconds, error):
+        with self._stats_lock:
+            self._stats.setdefault(name, CallStats()).record(seconds, error)
+        for listener in (*self._listeners, *_global_listeners):
+            listener(name, seconds, error)
+
+    def request(self, method, path, name=None, **kwargs):
+        """Send a request and return the decoded JSON body
+
+        Raises PaystackError on network failures and non-JSON responses.
+        """
+        return self.request_with_status(method, path, name=name, **kwargs)[1]
+
+    def request_with_status(self, method, path, name=None, **kwargs):
+        """Like request, but returns (HTTP status code, decoded JSON body)"""
+        name = name or f'{method} {path}'
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        error = True
+        try:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+            body = response.json()
+            error = response.status_code >= 500
+            return response.status_code, body
+        except (requests.RequestException, ValueError) as e:
+            raise PaystackError(str(e)) from e
+        finally:
+            self._record(name, time.perf_counter() - started, error)
+
+    def get_conditional(self, path, etag=None, name=None, **kwargs):
+        """GET with If-None-Match; returns (body, etag), body None on 304"""
+        name = name or f'GET {path}'
+        headers = dict(kwargs.pop('headers', None) or {})
+        if etag:
+            headers['If-None-Match'] = etag
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        error = True
+        try:
+            response = self.session.get(self.base_url + path, headers=headers, **kwargs)
+            error = response.status_code >= 500
+            if response.status_code == 304:
+                return None, etag
+            return response.json(), response.headers.get('ETag')
+        except (requests.RequestException, ValueError) as e:
+            raise PaystackError(str(e)) from e
+        finally:
+            self._record(name, time.perf_counter() - started, error)
+
+    def get(self, path, name=None, **kwargs):
+        return self.request('GET', path, name=name, **kwargs)
+
+    def post(self, path, name=None, **kwargs):
+        return self.request('POST', path, name=name, **kwargs)
+
+    def stats(self):
+        with self._stats_lock:
+            return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+# Listeners for every client, including ones created later in forked workers
+_global_listeners = []
+
+def add_global_listener(listener):
+    """Call listener(name, seconds, error) after every request by any client"""
+    if listener not in _global_listeners:
+        _global_listeners.append(listener)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_paystack_client(config=None):
+    """Return this worker's shared client, creating it on first use
+
+    Pass config explicitly when calling outside an application context.
+    """
+    global _client, _client_pid
+    # Sockets must not be shared across a fork, so the client is per process
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = PaystackClient.from_config(config or current_app.config)
+                _client_pid = os.getpid()
+    return _client
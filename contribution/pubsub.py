@@ -0,0 +1,269 @@
+"""
+Database-backed pub/sub for live updates
+
+Writes that change a user's notifications, balance or transfers append
+UserEvent rows in the same database transaction (see _publish_after_flush).
+Subscribers tail those rows by id through an index, so every gunicorn worker
+sees every event without an external broker. Subscribers in the worker that
+made the write are woken as soon as it commits. For writes made by other
+processes, one poller thread per process checks for new events every
+EVENT_POLL_INTERVAL seconds while anyone is subscribed and wakes the users
+they belong to, so the database sees one poll per process however many
+streams are open.
+
+An open stream holds a worker thread, so each process keeps at most
+EVENT_STREAM_SLOTS of them open. A page that connects when every slot is
+taken gets the current state and is asked to reconnect after
+EVENT_STREAM_BUSY_RETRY_SECONDS, which degrades it to the old 30 second
+polling instead of leaving no threads for ordinary requests.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db, Transaction, Notification, UserEvent
+
+logger = logging.getLogger(__name__)
+
+class EventBroker:
+    """Wakes local subscribers when their user's events are committed"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._generations = defaultdict(int)
+        self._subscribers = 0
+        self._poller = None
+
+    def subscribe(self, app, poll_interval, limit):
+        """Count a subscriber, starting the poller if it isn't running
+
+        Returns False, without subscribing, if limit subscribers already are.
+        """
+        with self._condition:
+            if self._subscribers >= limit:
+                return False
+            self._subscribers += 1
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll, args=(app, poll_interval),
+                                                name='event-poller', daemon=True)
+                self._poller.start()
+            return True
+
+    def unsubscribe(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def _poll(self, app, poll_interval):
+        """Wake subscribers for events committed by other processes"""
+        with app.app_context():
+            try:
+                last_id = db.session.query(db.func.max(UserEvent.id)).scalar() or 0
+                db.session.rollback()
+                while True:
+                    time.sleep(poll_interval)
+                    with self._condition:
+                        if not self._subscribers:
+                            self._poller = None
+                            return
+                    try:
+                        rows = db.session.query(UserEvent.id, UserEvent.user_id)\
+                            .filter(UserEvent.id > last_id)\
+                            .order_by(UserEvent.id.asc()).limit(1000).all()
+                        db.session.rollback()
+                    except Exception:
+                        logger.exception('Polling for live update events failed')
+                        db.session.rollback()
+                        continue
+                    if rows:
+                        last_id = rows[-1].id
+                        self.notify({row.user_id for row in rows})
+            finally:
+                db.session.remove()
+
+    def notify(self, user_ids):
+        with self._condition:
+            for user_id in user_ids:
+                self._generations[user_id] += 1
+            self._condition.notify_all()
+
+    def fetch(self, user_id, after_id, limit=100):
+        events = UserEvent.query.filter(
+            UserEvent.user_id == user_id,
+            UserEvent.id > after_id
+        ).order_by(UserEvent.id.asc()).limit(limit).all()
+        events = [user_event.to_dict() for user_event in events]
+        # Don't hold a read transaction open between polls
+        db.session.rollback()
+        return events
+
+    def latest_id(self, user_id):
+        latest = db.session.query(db.func.max(UserEvent.id))\
+            .filter(UserEvent.user_id == user_id).scalar()
+        db.session.rollback()
+        return latest or 0
+
+    def wait(self, user_id, after_id, timeout):
+        """Block until events newer than after_id exist or timeout elapses
+
+        The database is only read again when the user is woken, by a local
+        commit or the poller. An event committed out of id order can slip
+        past the poller; it is picked up by the next wait.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                generation = self._generations[user_id]
+            events = self.fetch(user_id, after_id)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            with self._condition:
+                woken = self._condition.wait_for(
+                    lambda: self._generations[user_id] != generation,
+                    timeout=remaining
+                )
+            if not woken:
+                return []
+
+broker = EventBroker()
+
+def _status_change(obj):
+    history = inspect(obj).attrs.status.history
+    return bool(history.deleted) and history.deleted[0] != obj.status
+
+@event.listens_for(Session, 'after_flush')
+def _publish_after_flush(session, flush_context):
+    changed = set()
+    transfers = []
+
+    for obj in chain(session.new, session.deleted):
+        if isinstance(obj, Notification):
+            changed.add((obj.user_id, 'notifications'))
+        elif isinstance(obj, Transaction):
+            changed.add((obj.user_id, 'balance'))
+
+    for obj in session.dirty:
+        if isinstance(obj, Notification) and inspect(obj).attrs.is_read.history.has_changes():
+            changed.add((obj.user_id, 'notifications'))
+        elif isinstance(obj, Transaction) and _status_change(obj):
+            changed.add((obj.user_id, 'balance'))
+            if obj.type == 'withdrawal':
+                transfers.append(obj)
+
+    rows = [{'user_id': user_id, 'kind': kind, 'payload': None} for user_id, kind in changed]
+    rows += [
+        {
+            'user_id': obj.user_id,
+            'kind': 'transfer',
+            'payload': json.dumps({'reference': obj.reference, 'status': obj.status})
+        }
+        for obj in transfers
+    ]
+    if not rows:
+        return
+
+    now = datetime.utcnow()
+    for row in rows:
+        row['created_at'] = now
+    session.connection().execute(UserEvent.__table__.insert(), rows)
+    session.info.setdefault('published_user_ids', set()).update(row['user_id'] for row in rows)
+
+def publish(session, user_id, kind, payload=None):
+    """Append an event from code paths that bypass the ORM flush"""
+    session.connection().execute(UserEvent.__table__.insert().values(
+        user_id=user_id,
+        kind=kind,
+        payload=json.dumps(payload) if payload is not None else None,
+        created_at=datetime.utcnow()
+    ))
+    session.info.setdefault('published_user_ids', set()).add(user_id)
+
+@event.listens_for(Session, 'after_commit')
+def _wake_subscribers(session):
+    user_ids = session.info.pop('published_user_ids', None)
+    if user_ids:
+        broker.notify(user_ids)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_published(session):
+    session.info.pop('published_user_ids', None)
+
+def prune_events(max_age):
+    """Delete events older than max_age (a timedelta); returns rows removed"""
+    cutoff = datetime.utcnow() - max_age
+    removed = UserEvent.query.filter(UserEvent.created_at < cutoff)\
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+def format_sse(data, event_name=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event_name:
+        lines.append(f'event: {event_name}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def stream_user_events(app, user_id, last_event_id=None):
+    """Generate the SSE stream for one user until the configured lifetime ends"""
+    from models import User
+
+    with app.app_context():
+        max_seconds = app.config.get('EVENT_STREAM_MAX_SECONDS', 55)
+        poll_interval = app.config.get('EVENT_POLL_INTERVAL', 5)
+        keepalive = app.config.get('EVENT_KEEPALIVE_SECONDS', 15)
+        slots = app.config.get('EVENT_STREAM_SLOTS', 12)
+        busy_retry = app.config.get('EVENT_STREAM_BUSY_RETRY_SECONDS', 30)
+
+        def current_state(event_id, kinds=('notifications', 'balance')):
+            user = db.session.get(User, user_id)
+            values = {
+                'notifications': {'count': user.unread_notification_count},
+                'balance': {'balance': user.get_total_savings()}
+            }
+            db.session.rollback()
+            return [format_sse(values[kind], kind, event_id) for kind in kinds]
+
+        if not broker.subscribe(app, poll_interval, slots):
+            # Every slot is taken: answer like a poll and free the thread
+            try:
+                after_id = last_event_id if last_event_id is not None else broker.latest_id(user_id)
+                yield f'retry: {busy_retry * 1000}\n\n'
+                yield from current_state(after_id)
+            finally:
+                db.session.remove()
+            return
+
+        try:
+            after_id = last_event_id if last_event_id is not None else broker.latest_id(user_id)
+            yield f'retry: {poll_interval * 1000}\n\n'
+            yield from current_state(after_id)
+
+            deadline = time.monotonic() + max_seconds
+            while time.monotonic() < deadline:
+                timeout = min(keepalive, deadline - time.monotonic())
+                events = broker.wait(user_id, after_id, timeout)
+                if not events:
+                    yield ': keepalive\n\n'
+                    continue
+
+                after_id = events[-1]['id']
+                for user_event in events:
+                    if user_event['kind'] == 'transfer':
+                        yield format_sse(user_event['payload'], 'transfer', user_event['id'])
+                changed = [kind for kind in ('notifications', 'balance')
+                           if any(user_event['kind'] == kind for user_event in events)]
+                if changed:
+                    yield from current_state(after_id, changed)
+        finally:
+            broker.unsubscribe()
+            db.session.remove()
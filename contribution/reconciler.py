@@ -0,0 +1,257 @@
+"""
+Reconciliation of pending Paystack payments
+
+Deposits and withdrawals otherwise only settle when the browser polls
+verify-payment or transfer-status, so abandoned ones would stay pending
+forever. The reconciler walks aged pending rows in (created_at, id) order
+through ix_transaction_status_created, checks each batch against Paystack
+on a small thread pool and settles the results with set-based writes.
+
+A payment only expires on Paystack's explicit not-found for its reference,
+and only deposits expire: a withdrawal is refunded on a verified failed or
+reversed transfer, so an old one Paystack can't find is reported for
+manual review instead.
+
+Those writes bypass the ORM, so the mapper events that maintain balances,
+rollups, unread counters, data versions and live update events don't run;
+settle_batch() applies each of them explicitly.
+"""
+
+import logging
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from models import (db, Transaction, Notification, ledger_delta, adjust_user_balance,
+                    apply_batch_to_rollups, adjust_unread_count, bump_data_version)
+from pubsub import publish
+from utils import verify_paystack_payment
+from utils_paystack_transfer import verify_transfer_by_reference
+
+logger = logging.getLogger(__name__)
+
+# Paystack statuses that settle a payment; anything else is still in flight
+DEPOSIT_OUTCOMES = {'success': 'completed', 'failed': 'failed', 'abandoned': 'failed', 'reversed': 'failed'}
+TRANSFER_OUTCOMES = {'success': 'completed', 'failed': 'failed', 'reversed': 'failed'}
+
+class ReconcileReport:
+    """Counters for one reconciliation pass"""
+
+    def __init__(self):
+        self.checked = 0
+        self.completed = 0
+        self.failed = 0
+        self.errors = 0
+        self.unresolved = []  # references of withdrawals needing manual review
+        self.oldest_pending_seconds = 0.0
+        self.total_settle_lag = 0.0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def still_pending(self):
+        return self.checked - self.completed - self.failed
+
+    @property
+    def throughput(self):
+        return self.checked / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mean_settle_lag_seconds(self):
+        settled = self.completed + self.failed
+        return self.total_settle_lag / settled if settled else 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def to_dict(self):
+        return {
+            'checked': self.checked,
+            'completed': self.completed,
+            'failed': self.failed,
+            'still_pending': self.still_pending,
+            'errors': self.errors,
+            'unresolved': self.unresolved,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'checks_per_second': round(self.throughput, 2),
+            'oldest_pending_seconds': round(self.oldest_pending_seconds, 1),
+            'mean_settle_lag_seconds': round(self.mean_settle_lag_seconds, 1)
+        }
+
+def pending_batches(min_age, batch_size):
+    """Yield batches of aged pending Paystack transactions, oldest first"""
+    cutoff = datetime.utcnow() - min_age
+    columns = (Transaction.id, Transaction.user_id, Transaction.type, Transaction.amount,
+               Transaction.category, Transaction.reference, Transaction.created_at)
+    last = None
+    while True:
+        query = db.session.query(*columns).filter(
+            Transaction.status == 'pending',
+            Transaction.created_at <= cutoff,
+            Transaction.type.in_(('deposit', 'withdrawal')),
+            db.or_(Transaction.payment_method.is_(None), Transaction.payment_method == 'paystack')
+        )
+        if last is not None:
+            query = query.filter(db.or_(
+                Transaction.created_at > last.created_at,
+                db.and_(Transaction.created_at == last.created_at, Transaction.id > last.id)
+            ))
+        batch = query.order_by(Transaction.created_at.asc(), Transaction.id.asc()).limit(batch_size).all()
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+def check_payment(row, expire_before):
+    """Ask Paystack about one pending row
+
+    Returns 'completed' or 'failed' to settle it, 'unresolved' for an expired
+    withdrawal that can't safely be failed, or None to leave it pending.
+    """
+    if row.type == 'deposit':
+        response, outcomes = verify_paystack_payment(row.reference), DEPOSIT_OUTCOMES
+    else:
+        response, outcomes = verify_transfer_by_reference(row.reference), TRANSFER_OUTCOMES
+
+    if response.get('status'):
+        return outcomes.get((response.get('data') or {}).get('status'))
+    if not response.get('not_found'):
+        # Network errors, rate limits or a bad key say nothing about the payment
+        raise ConnectionError(response.get('message'))
+    if row.created_at >= expire_before:
+        return None
+    # Paystack has never heard of it
+    return 'failed' if row.type == 'deposit' else 'unresolved'
+
+def _notification(row, status, now):
+    if row.type == 'deposit':
+        if status != 'completed':
+            return None
+        title, message, type = ('Deposit Successful',
+                                f'₦{row.amount:,.2f} has been deposited successfully to your account.',
+                                'success')
+    elif status == 'completed':
+        title, message, type = ('Withdrawal Completed',
+                                f'₦{row.amount:,.2f} has been successfully transferred to your bank account.',
+                                'success')
+    else:
+        title, message, type = ('Withdrawal Failed',
+                                f'Withdrawal of ₦{row.amount:,.2f} failed. Please try again.',
+                                'error')
+    return {'user_id': row.user_id, 'title': title, 'message': message, 'type': type,
+            'is_read': False, 'created_at': now}
+
+def settle_batch(rows, outcomes):
+    """Write the outcomes {id: status} for rows; returns {id: status} actually applied"""
+    now = datetime.utcnow()
+    connection = db.session.connection()
+    transactions = Transaction.__table__
+
+    settled = {}
+    for status in ('completed', 'failed'):
+        ids = [row.id for row in rows if outcomes.get(row.id) == status]
+        if not ids:
+            continue
+        values = {'status': status}
+        if status == 'completed':
+            values['completed_at'] = now
+        # Rows settled meanwhile by verify-payment or transfer-status are skipped
+        result = connection.execute(
+            transactions.update()
+            .where(transactions.c.id.in_(ids), transactions.c.status == 'pending')
+            .values(**values)
+            .returning(transactions.c.id)
+        )
+        settled.update((transaction_id, status) for (transaction_id,) in result)
+
+    rows = [row for row in rows if row.id in settled]
+    if not rows:
+        db.session.commit()
+        return settled
+
+    balance_deltas = defaultdict(float)
+    unread = Counter()
+    notifications = []
+    for row in rows:
+        status = settled[row.id]
+        balance_deltas[row.user_id] += (ledger_delta(row.type, row.amount, status)
+                                        - ledger_delta(row.type, row.amount, 'pending'))
+        notification = _notification(row, status, now)
+        if notification is not None:
+            notifications.append(notification)
+            unread[row.user_id] += 1
+        if row.type == 'withdrawal':
+            publish(db.session, row.user_id, 'transfer', {'reference': row.reference, 'status': status})
+
+    for user_id, delta in balance_deltas.items():
+        adjust_user_balance(connection, user_id, delta)
+    apply_batch_to_rollups(connection, [
+        (row.user_id, row.type, row.amount, row.category, row.created_at)
+        for row in rows if settled[row.id] == 'completed'
+    ])
+    if notifications:
+        connection.execute(Notification.__table__.insert(), notifications)
+        for user_id, count in unread.items():
+            adjust_unread_count(connection, user_id, count)
+
+    user_ids = {row.user_id for row in rows}
+    bump_data_version(connection, user_ids)
+    for user_id in user_ids:
+        publish(db.session, user_id, 'balance')
+        if unread[user_id]:
+            publish(db.session, user_id, 'notifications')
+
+    db.session.commit()
+    return settled
+
+def reconcile_pending(app, min_age, expire_after, batch_size=100, concurrency=8):
+    """Run one pass over aged pending payments and return its ReconcileReport"""
+    report = ReconcileReport()
+    expire_before = datetime.utcnow() - expire_after
+
+    def check(row):
+        with app.app_context():
+            try:
+                return row.id, check_payment(row, expire_before)
+            except Exception as e:
+                logger.warning('Could not check %s %s: %s', row.type, row.reference, e)
+                return row.id, e
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='reconcile') as pool:
+        for batch in pending_batches(min_age, batch_size):
+            # Don't hold a read transaction open while Paystack is called
+            db.session.rollback()
+            if not report.checked:
+                report.oldest_pending_seconds = (datetime.utcnow() - batch[0].created_at).total_seconds()
+
+            outcomes = {}
+            row_references = {row.id: row.reference for row in batch}
+            for transaction_id, outcome in pool.map(check, batch):
+                if isinstance(outcome, Exception):
+                    report.errors += 1
+                elif outcome == 'unresolved':
+                    report.unresolved.append(row_references[transaction_id])
+                elif outcome is not None:
+                    outcomes[transaction_id] = outcome
+            report.checked += len(batch)
+
+            settled = settle_batch(batch, outcomes) if outcomes else {}
+            now = datetime.utcnow()
+            for row in batch:
+                status = settled.get(row.id)
+                if status is None:
+                    continue
+                if status == 'completed':
+                    report.completed += 1
+                else:
+                    report.failed += 1
+                report.total_settle_lag += (now - row.created_at).total_seconds()
+
+    report.finish()
+    logger.info('Reconciled pending payments: %s', report.to_dict())
+    if report.unresolved:
+        logger.warning('Withdrawals Paystack has no transfer for, needing manual review: %s',
+                       ', '.join(report.unresolved))
+    return report
@@ -0,0 +1,77 @@
+"""
+Read replica routing
+
+With REPLICA_DATABASE_URL set, views marked @read_replica run their queries
+on the replica engine; writes, and everything outside those views, stay on
+the primary. Two checks keep users from reading behind their own writes:
+
+- A commit that wrote anything stamps the user's session cookie, and for
+  REPLICA_STICKY_SECONDS afterwards their reads go to the primary. The
+  cookie travels with the user, so this holds across gunicorn workers and
+  app servers.
+- Otherwise the user's data_version on the replica is compared with the
+  primary's (current_user is always loaded from the primary). A replica
+  that hasn't caught up yet is skipped, which also keeps the version-keyed
+  ETags and fragment caches from storing stale pages under a new version.
+"""
+
+import time
+from functools import wraps
+
+from flask import current_app, has_request_context, session as cookie_session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, User
+
+STICKY_KEY = '_primary_until'
+
+def replica_configured():
+    return 'replica' in db.engines
+
+def _sticky():
+    return time.time() < cookie_session.get(STICKY_KEY, 0)
+
+def _replica_caught_up():
+    """The replica has applied every write to the current user's data"""
+    if not current_user.is_authenticated:
+        return True
+    version = db.session.query(User.data_version).filter(User.id == current_user.id).scalar()
+    return version is not None and version >= current_user.data_version
+
+def read_replica(view):
+    """Run a read-only view's queries on the replica when it is safe to"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not replica_configured() or _sticky():
+            return view(*args, **kwargs)
+
+        # Loads current_user from the primary before switching
+        current_user._get_current_object()
+        db.session.info['use_replica'] = True
+        try:
+            if not _replica_caught_up():
+                db.session.info.pop('use_replica')
+            return view(*args, **kwargs)
+        finally:
+            db.session.info.pop('use_replica', None)
+    return wrapper
+
+@event.listens_for(Session, 'after_flush')
+def _note_flush(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _stick_to_primary(session):
+    if session.info.pop('wrote', False) and has_request_context() and replica_configured():
+        cookie_session[STICKY_KEY] = time.time() + current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_write(session):
+    session.info.pop('wrote', None)
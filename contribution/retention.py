@@ -0,0 +1,105 @@
+"""
+Notification retention
+
+The notification table only needs to hold what users still look at.
+`flask notifications archive` moves two kinds of rows to
+notification_archive: read notifications older than
+NOTIFICATION_RETENTION_DAYS, and everything beyond a user's newest
+NOTIFICATION_MAX_PER_USER. Rows move in chunks of
+NOTIFICATION_ARCHIVE_BATCH_SIZE, each in its own short transaction, so
+the table is never locked for long and a run can be interrupted at any
+point.
+
+The moves bypass the ORM, so archive_chunk() adjusts unread counters,
+data versions and live update events itself.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+
+from models import db, Notification, NotificationArchive, adjust_unread_count, bump_data_version
+from pubsub import publish
+
+ARCHIVED_COLUMNS = ('user_id', 'title', 'message', 'type', 'is_read', 'created_at')
+
+def expired_read_ids(cutoff, batch_size):
+    """Yield chunks of ids of read notifications created before cutoff"""
+    last_id = 0
+    while True:
+        ids = [notification_id for (notification_id,) in db.session.query(Notification.id).filter(
+            Notification.id > last_id,
+            Notification.is_read == True,  # noqa: E712
+            Notification.created_at < cutoff
+        ).order_by(Notification.id).limit(batch_size)]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+def overflow_ids(max_per_user, batch_size):
+    """Yield chunks of ids older than each user's newest max_per_user notifications"""
+    user_ids = [user_id for (user_id,) in db.session.query(Notification.user_id)
+                .group_by(Notification.user_id)
+                .having(db.func.count(Notification.id) > max_per_user)]
+    key = db.tuple_(Notification.created_at, Notification.id)
+    for user_id in user_ids:
+        # The oldest notification the user keeps
+        boundary = db.session.query(Notification.created_at, Notification.id)\
+            .filter(Notification.user_id == user_id)\
+            .order_by(Notification.created_at.desc(), Notification.id.desc())\
+            .offset(max_per_user - 1).limit(1).first()
+        if boundary is None:
+            continue
+        while True:
+            # Each chunk is gone once archived, so always read from the oldest
+            ids = [notification_id for (notification_id,) in db.session.query(Notification.id).filter(
+                Notification.user_id == user_id,
+                key < db.tuple_(*boundary)
+            ).order_by(Notification.created_at, Notification.id).limit(batch_size)]
+            if not ids:
+                break
+            yield ids
+
+def archive_chunk(ids):
+    """Move the given notifications to the archive and commit; returns rows moved"""
+    notifications = Notification.__table__
+    connection = db.session.connection()
+    connection.execute(NotificationArchive.__table__.insert().from_select(
+        ['notification_id', *ARCHIVED_COLUMNS, 'archived_at'],
+        db.select(
+            notifications.c.id,
+            *(notifications.c[name] for name in ARCHIVED_COLUMNS),
+            db.literal(datetime.utcnow(), db.DateTime)
+        ).where(notifications.c.id.in_(ids))
+    ))
+    moved = connection.execute(
+        notifications.delete()
+        .where(notifications.c.id.in_(ids))
+        .returning(notifications.c.user_id, notifications.c.is_read)
+    ).all()
+
+    unread = Counter(user_id for user_id, is_read in moved if not is_read)
+    for user_id, count in unread.items():
+        adjust_unread_count(connection, user_id, -count)
+    user_ids = {user_id for user_id, _ in moved}
+    bump_data_version(connection, user_ids)
+    for user_id in user_ids:
+        publish(db.session, user_id, 'notifications')
+
+    db.session.commit()
+    return len(moved)
+
+def archive_notifications(retention_days=None, max_per_user=None, batch_size=500):
+    """Apply the retention policy; returns (expired, overflow) rows archived
+
+    Either rule is skipped when its setting is None or 0.
+    """
+    expired = overflow = 0
+    if retention_days:
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        for ids in expired_read_ids(cutoff, batch_size):
+            expired += archive_chunk(ids)
+    if max_per_user:
+        for ids in overflow_ids(max_per_user, batch_size):
+            overflow += archive_chunk(ids)
+    return expired, overflow
@@ -1,9 +1,9 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session, Response, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
-from utils_paystack_transfer import get_banks_list, validate_bank_details
+import math
 import os
 import secrets
 from PIL import Image
@@ -11,41 +11,57 @@ from functools import wraps
 import requests
 import json
 
-from models import db, User, Transaction, Goal, BankAccount, DailyGoal, Notification
+from models import db, User, Transaction, Goal, BankAccount, DailyGoal, Notification, bump_data_version, reset_unread_count
 from forms import LoginForm, RegistrationForm, GoalForm, TransactionForm, BankAccountForm, ProfileForm, DailyGoalForm, DepositForm
-from utils import save_picture, send_reset_email, generate_reference, verify_paystack_payment, init_paystack_payment
+from utils import save_picture, send_reset_email, generate_reference, verify_paystack_payment, init_paystack_payment, get_monthly_summary
+from pagination import keyset_paginate
+from dashboard import DashboardSnapshot
+from pubsub import publish, stream_user_events
+from bank_directory import get_bank_directory
+from account_resolver import get_account_resolver
+from withdrawals import request_withdrawal, complete_withdrawal, fail_withdrawal
+from webhooks import complete_deposit, verify_signature, record_event
+from http_cache import versioned
+from unit_of_work import notify
+from replicas import read_replica
+from extensions import is_admin_user
 
 main_bp = Blueprint('main', __name__)
 
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or current_user.email != 'admin@example.com':
+        if not is_admin_user(current_user):
             flash('Admin access required', 'error')
             return redirect(url_for('main.index'))
         return f(*args, **kwargs)
     return decorated_function
 
+def _listing_page(query, sort_column, id_column, per_page):
+    """Keyset-paginate a listing using the cursor/count query arguments"""
+    return keyset_paginate(
+        query, sort_column, id_column,
+        cursor=request.args.get('cursor'),
+        per_page=per_page,
+        with_total=request.args.get('count', 0, type=int) == 1
+    )
+
+def _wants_json():
+    return request.args.get('format') == 'json'
+
 @main_bp.route('/api/nigeria-banks')
 @login_required
 def get_nigeria_banks():
     """API endpoint to get list of Nigeria banks"""
-    try:
-        banks_response = get_banks_list()
-        if banks_response.get('status'):
-            banks = banks_response.get('data', [])
-            formatted_banks = [
-                {
-                    'code': bank['code'],
-                    'name': bank['name']
-                }
-                for bank in banks
-            ]
-            return jsonify({'status': 'success', 'banks': formatted_banks})
-        else:
-            return jsonify({'status': 'error', 'message': 'Failed to fetch banks'}), 500
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    banks, etag = get_bank_directory().get()
+    if banks is None:
+        return jsonify({'status': 'error', 'message': 'Failed to fetch banks'}), 503
+    
+    response = jsonify({'status': 'success', 'banks': banks})
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config.get('BANK_LIST_BROWSER_MAX_AGE', 3600)
+    return response.make_conditional(request)
 
 @main_bp.route('/api/verify-account', methods=['POST'])
 @login_required
@@ -59,7 +75,7 @@ def verify_bank_account():
         if not account_number or not bank_code:
             return jsonify({'status': 'error', 'message': 'Account number and bank code required'}), 400
         
-        verification_response = validate_bank_details(account_number, bank_code)
+        verification_response = get_account_resolver().resolve(account_number, bank_code)
         
         if verification_response.get('status'):
             account_data = verification_response.get('data', {})
@@ -97,16 +113,7 @@ def register():
         user.set_password(form.password.data)
         
         db.session.add(user)
-        db.session.commit()
-        
-        # Create welcome notification
-        notification = Notification(
-            user_id=user.id,
-            title='Welcome to Money Saver!',
-            message='Your account has been created successfully. Start saving today!',
-            type='success'
-        )
-        db.session.add(notification)
+        notify(user, 'Welcome to Money Saver!', 'Your account has been created successfully. Start saving today!')
         db.session.commit()
         
         flash('Registration successful! Please log in.', 'success')
@@ -139,44 +146,23 @@ def logout():
 
 @main_bp.route('/dashboard')
 @login_required
+@read_replica
 def dashboard():
-    # Get user statistics
-    total_savings = current_user.get_total_savings()
-    total_goals = current_user.get_total_goals()
-    completed_goals = current_user.get_completed_goals()
-    
-    # Get recent transactions
-    recent_transactions = Transaction.query.filter_by(user_id=current_user.id)\
-        .order_by(Transaction.created_at.desc()).limit(5).all()
-    
-    # Get active goals
-    active_goals = Goal.query.filter_by(user_id=current_user.id, status='active')\
-        .order_by(Goal.deadline.asc()).limit(3).all()
-    
-    # Get today's daily goal
-    today = datetime.utcnow().date()
-    today_goal = DailyGoal.query.filter_by(user_id=current_user.id, date=today).first()
-    
-    # Get notifications
-    notifications = Notification.query.filter_by(user_id=current_user.id)\
-        .order_by(Notification.created_at.desc()).limit(5).all()
-    
-    return render_template('dashboard.html',
-                         total_savings=total_savings,
-                         total_goals=total_goals,
-                         completed_goals=completed_goals,
-                         recent_transactions=recent_transactions,
-                         active_goals=active_goals,
-                         today_goal=today_goal,
-                         notifications=notifications)
+    # Served from the per-user snapshot cache; rebuilt after any write
+    snapshot = DashboardSnapshot.for_user(current_user)
+    
+    return render_template('dashboard.html', **snapshot.template_context())
 
 @main_bp.route('/transactions')
 @login_required
+@read_replica
 def transactions():
-    page = request.args.get('page', 1, type=int)
-    transactions = Transaction.query.filter_by(user_id=current_user.id)\
-        .order_by(Transaction.created_at.desc())\
-        .paginate(page=page, per_page=10, error_out=False)
+    transactions = _listing_page(
+        Transaction.query.filter_by(user_id=current_user.id),
+        Transaction.created_at, Transaction.id, per_page=10
+    )
+    if _wants_json():
+        return jsonify(transactions.to_dict())
     
     return render_template('transactions.html', transactions=transactions)
 
@@ -194,18 +180,11 @@ def add_transaction():
             payment_method=form.payment_method.data,
             reference=generate_reference()
         )
+        # A manual entry records money that has already moved
+        transaction.mark_completed()
         
         db.session.add(transaction)
-        db.session.commit()
-        
-        # Create notification
-        notification = Notification(
-            user_id=current_user.id,
-            title=f'{form.type.data.title()} Added',
-            message=f'₦{form.amount.data:,.2f} has been {form.type.data}d successfully.',
-            type='success'
-        )
-        db.session.add(notification)
+        notify(current_user, f'{form.type.data.title()} Added', f'₦{form.amount.data:,.2f} has been {form.type.data}d successfully.')
         db.session.commit()
         
         flash('Transaction added successfully!', 'success')
@@ -215,11 +194,14 @@ def add_transaction():
 
 @main_bp.route('/goals')
 @login_required
+@read_replica
 def goals():
-    page = request.args.get('page', 1, type=int)
-    goals = Goal.query.filter_by(user_id=current_user.id)\
-        .order_by(Goal.created_at.desc())\
-        .paginate(page=page, per_page=10, error_out=False)
+    goals = _listing_page(
+        Goal.query.filter_by(user_id=current_user.id),
+        Goal.created_at, Goal.id, per_page=10
+    )
+    if _wants_json():
+        return jsonify(goals.to_dict())
     
     return render_template('goals.html', goals=goals)
 
@@ -239,16 +221,7 @@ def add_goal():
         )
         
         db.session.add(goal)
-        db.session.commit()
-        
-        # Create notification
-        notification = Notification(
-            user_id=current_user.id,
-            title='New Goal Created',
-            message=f'Your goal "{form.title.data}" has been created successfully.',
-            type='success'
-        )
-        db.session.add(notification)
+        notify(current_user, 'New Goal Created', f'Your goal "{form.title.data}" has been created successfully.')
         db.session.commit()
         
         flash('Goal created successfully!', 'success')
@@ -258,11 +231,14 @@ def add_goal():
 
 @main_bp.route('/daily-goals')
 @login_required
+@read_replica
 def daily_goals():
-    page = request.args.get('page', 1, type=int)
-    daily_goals = DailyGoal.query.filter_by(user_id=current_user.id)\
-        .order_by(DailyGoal.date.desc())\
-        .paginate(page=page, per_page=10, error_out=False)
+    daily_goals = _listing_page(
+        DailyGoal.query.filter_by(user_id=current_user.id),
+        DailyGoal.date, DailyGoal.id, per_page=10
+    )
+    if _wants_json():
+        return jsonify(daily_goals.to_dict())
     
     return render_template('daily_goals.html', daily_goals=daily_goals)
 
@@ -292,8 +268,11 @@ def profile():
     form = ProfileForm()
     if form.validate_on_submit():
         if form.picture.data:
-            picture_file = save_picture(form.picture.data)
-            current_user.profile_picture = picture_file
+            try:
+                current_user.profile_picture = save_picture(form.picture.data)
+            except ValueError as e:
+                flash(str(e), 'error')
+                return redirect(url_for('main.profile'))
         
         current_user.first_name = form.first_name.data
         current_user.last_name = form.last_name.data
@@ -308,11 +287,11 @@ def profile():
         form.last_name.data = current_user.last_name
         form.phone.data = current_user.phone
     
-    profile_image = url_for('static', filename='images/' + current_user.profile_picture)
-    return render_template('profile.html', form=form, profile_image=profile_image)
+    return render_template('profile.html', form=form)
 
 @main_bp.route('/bank-accounts')
 @login_required
+@read_replica
 def bank_accounts():
     accounts = BankAccount.query.filter_by(user_id=current_user.id).all()
     return render_template('bank_accounts.html', accounts=accounts)
@@ -346,16 +325,7 @@ def add_bank_account():
         )
         
         db.session.add(account)
-        db.session.commit()
-        
-        # Create notification
-        notification = Notification(
-            user_id=current_user.id,
-            title='Bank Account Added',
-            message=f'Your {form.bank_name.data} account has been successfully added.',
-            type='success'
-        )
-        db.session.add(notification)
+        notify(current_user, 'Bank Account Added', f'Your {form.bank_name.data} account has been successfully added.')
         db.session.commit()
         
         flash('Bank account added successfully! Your account has been verified and saved to your profile.', 'success')
@@ -415,16 +385,7 @@ def save_verified_account():
         )
         
         db.session.add(account)
-        db.session.commit()
-        
-        # Create notification
-        notification = Notification(
-            user_id=current_user.id,
-            title='Bank Account Added',
-            message=f'Your {data["bank_name"]} account has been successfully added and verified.',
-            type='success'
-        )
-        db.session.add(notification)
+        notify(current_user, 'Bank Account Added', f'Your {data["bank_name"]} account has been successfully added and verified.')
         db.session.commit()
         
         return jsonify({
@@ -469,7 +430,7 @@ def deposit():
         # Initialize Paystack payment
         payment_data = init_paystack_payment(
             email=current_user.email,
-            amount=amount * 100,  # Paystack amount in kobo
+            amount=amount,
             reference=generate_reference()
         )
         
@@ -480,6 +441,7 @@ def deposit():
                 amount=amount,
                 type='deposit',
                 description=form.description.data or f'Deposit via bank account {bank_account_id}',
+                payment_method='paystack',
                 reference=payment_data['data']['reference'],
                 status='pending'
             )
@@ -499,7 +461,12 @@ def deposit():
 @login_required
 def withdraw():
     if request.method == 'POST':
-        amount = float(request.form.get('amount'))
+        try:
+            amount = float(request.form.get('amount', ''))
+        except ValueError:
+            amount = None
+        if amount is None or not (amount > 0 and math.isfinite(amount)):
+            return jsonify({'status': 'error', 'message': 'Enter a valid amount'})
         bank_account_id = request.form.get('bank_account_id')
         
         # Check if user has sufficient balance
@@ -512,59 +479,11 @@ def withdraw():
         if not bank_account:
             return jsonify({'status': 'error', 'message': 'Invalid bank account'})
         
-        # Create or get recipient code for Paystack transfer
-        from utils_paystack_transfer import create_transfer_recipient, initiate_bank_transfer
-        
-        if not bank_account.recipient_code:
-            # Create recipient if not exists
-            recipient_response = create_transfer_recipient(
-                name=bank_account.account_name,
-                account_number=bank_account.account_number,
-                bank_code=bank_account.bank_code
-            )
-            
-            if recipient_response.get('status'):
-                bank_account.recipient_code = recipient_response['data']['recipient_code']
-                db.session.commit()
-            else:
-                return jsonify({'status': 'error', 'message': 'Failed to create transfer recipient'})
-        
-        # Generate unique reference
-        transfer_reference = generate_reference()
-        
-        # Initiate Paystack transfer
-        transfer_response = initiate_bank_transfer(
-            amount=amount,
-            recipient_code=bank_account.recipient_code,
-            reference=transfer_reference
-        )
+        # The transfer itself is made by the job worker
+        transaction = request_withdrawal(current_user, bank_account, amount)
+        db.session.commit()
         
-        if transfer_response.get('status'):
-            # Create transaction record
-            transaction = Transaction(
-                user_id=current_user.id,
-                amount=amount,
-                type='withdrawal',
-                description=f'Withdrawal to {bank_account.bank_name} - {bank_account.account_number}',
-                reference=transfer_reference,
-                status='pending'
-            )
-            db.session.add(transaction)
-            db.session.commit()
-            
-            # Create notification
-            notification = Notification(
-                user_id=current_user.id,
-                title='Withdrawal Initiated',
-                message=f'₦{amount:,.2f} withdrawal has been initiated to your bank account. Transfer will be processed shortly.',
-                type='info'
-            )
-            db.session.add(notification)
-            db.session.commit()
-            
-            return jsonify({'status': 'success', 'message': 'Withdrawal initiated successfully', 'transfer_reference': transfer_reference})
-        else:
-            return jsonify({'status': 'error', 'message': transfer_response.get('message', 'Transfer failed')})
+        return jsonify({'status': 'success', 'message': 'Withdrawal initiated successfully', 'transfer_reference': transaction.reference})
     
     accounts = BankAccount.query.filter_by(user_id=current_user.id, is_verified=True).all()
     return render_template('withdraw.html', accounts=accounts)
@@ -573,44 +492,36 @@ def withdraw():
 @login_required
 def transfer_status(transfer_reference):
     """Check the status of a Paystack transfer"""
-    from utils_paystack_transfer import verify_transfer_status
+    from utils_paystack_transfer import verify_transfer_by_reference
     
     transaction = Transaction.query.filter_by(
         reference=transfer_reference,
         user_id=current_user.id
     ).first_or_404()
     
+    # Settled withdrawals (e.g. by webhook) don't need another upstream check
+    if transaction.status in ('completed', 'failed'):
+        return jsonify({
+            'status': 'success',
+            'transfer_status': 'success' if transaction.status == 'completed' else 'failed',
+            'message': ''
+        })
+    
     # Verify transfer status
-    status_response = verify_transfer_status(transfer_reference)
+    status_response = verify_transfer_by_reference(transfer_reference)
+    
+    # Paystack hasn't seen it yet: the job worker is still to make the transfer
+    if status_response.get('not_found'):
+        return jsonify({'status': 'success', 'transfer_status': 'pending', 'message': ''})
     
     if status_response.get('status'):
         transfer_data = status_response.get('data', {})
         
         # Update transaction status based on transfer status
         if transfer_data.get('status') == 'success':
-            transaction.status = 'completed'
-            transaction.completed_at = datetime.utcnow()
-            
-            # Create success notification
-            notification = Notification(
-                user_id=current_user.id,
-                title='Withdrawal Completed',
-                message=f'₦{transaction.amount:,.2f} has been successfully transferred to your bank account.',
-                type='success'
-            )
-            db.session.add(notification)
-            
-        elif transfer_data.get('status') == 'failed':
-            transaction.status = 'failed'
-            
-            # Create failure notification
-            notification = Notification(
-                user_id=current_user.id,
-                title='Withdrawal Failed',
-                message=f'Withdrawal of ₦{transaction.amount:,.2f} failed. Please try again.',
-                type='error'
-            )
-            db.session.add(notification)
+            complete_withdrawal(transaction)
+        elif transfer_data.get('status') in ('failed', 'reversed'):
+            fail_withdrawal(transaction)
         
         db.session.commit()
         
@@ -625,19 +536,24 @@ def transfer_status(transfer_reference):
 @main_bp.route('/notifications')
 @login_required
 def notifications():
-    page = request.args.get('page', 1, type=int)
-    notifications = Notification.query.filter_by(user_id=current_user.id)\
-        .order_by(Notification.created_at.desc())\
-        .paginate(page=page, per_page=20, error_out=False)
-    
     # Mark all as read
     if request.args.get('mark_all_read'):
         Notification.query.filter_by(user_id=current_user.id, is_read=False)\
             .update({'is_read': True})
+        reset_unread_count(db.session.connection(), current_user.id)
+        bump_data_version(db.session.connection(), [current_user.id])
+        publish(db.session, current_user.id, 'notifications')
         db.session.commit()
         flash('All notifications marked as read', 'success')
         return redirect(url_for('main.notifications'))
     
+    notifications = _listing_page(
+        Notification.query.filter_by(user_id=current_user.id),
+        Notification.created_at, Notification.id, per_page=20
+    )
+    if _wants_json():
+        return jsonify(notifications.to_dict())
+    
     return render_template('notifications.html', notifications=notifications)
 
 @main_bp.route('/api/notifications/<int:notification_id>/mark-read', methods=['POST'])
@@ -656,12 +572,25 @@ def mark_notification_read(notification_id):
 
 @main_bp.route('/api/notifications/unread-count')
 @login_required
+@versioned
 def unread_notifications_count():
-    count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-    return jsonify({'count': count})
+    return jsonify({'count': current_user.unread_notification_count})
+
+@main_bp.route('/api/events/stream')
+@login_required
+def event_stream():
+    """Server-sent events for unread counts, balance and transfer status"""
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    stream = stream_user_events(current_app._get_current_object(), current_user.id, last_event_id)
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @main_bp.route('/api/goals/<int:goal_id>/progress')
 @login_required
+@versioned
+@read_replica
 def goal_progress(goal_id):
     goal = Goal.query.filter_by(id=goal_id, user_id=current_user.id).first_or_404()
     return jsonify({
@@ -672,74 +601,71 @@ def goal_progress(goal_id):
 
 @main_bp.route('/api/transactions/summary')
 @login_required
+@versioned
+@read_replica
 def transactions_summary():
-    # Get summary for current month
-    now = datetime.utcnow()
-    start_of_month = datetime(now.year, now.month, 1)
-    
-    deposits = Transaction.query.filter_by(
-        user_id=current_user.id,
-        type='deposit',
-        status='completed'
-    ).filter(Transaction.created_at >= start_of_month).all()
-    
-    withdrawals = Transaction.query.filter_by(
-        user_id=current_user.id,
-        type='withdrawal',
-        status='completed'
-    ).filter(Transaction.created_at >= start_of_month).all()
-    
-    total_deposits = sum(t.amount for t in deposits)
-    total_withdrawals = sum(t.amount for t in withdrawals)
+    # Get summary for current month from the monthly rollup
+    summary = get_monthly_summary(current_user.id)
     
     return jsonify({
-        'total_deposits': total_deposits,
-        'total_withdrawals': total_withdrawals,
-        'net_savings': total_deposits - total_withdrawals
+        'total_deposits': summary['total_deposits'],
+        'total_withdrawals': summary['total_withdrawals'],
+        'net_savings': summary['net_savings']
     })
 
+@main_bp.route('/webhooks/paystack', methods=['POST'])
+def paystack_webhook():
+    """Receive Paystack events; they are applied by the job worker"""
+    body = request.get_data()
+    if not verify_signature(current_app.config['PAYSTACK_SECRET_KEY'], body,
+                            request.headers.get('x-paystack-signature')):
+        return jsonify({'status': 'error', 'message': 'Invalid signature'}), 401
+    
+    try:
+        record_event(body)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid payload'}), 400
+    db.session.commit()
+    
+    return jsonify({'status': 'success'})
+
 @main_bp.route('/api/verify-payment/<reference>', methods=['POST'])
 @login_required
 def verify_payment(reference):
     """Verify Paystack payment and update transaction"""
     try:
+        # Find the transaction
+        transaction = Transaction.query.filter_by(
+            reference=reference,
+            user_id=current_user.id
+        ).first()
+        
+        if not transaction:
+            return jsonify({'status': 'error', 'message': 'Transaction not found'})
+        
+        # The webhook usually settles the deposit first; no need to ask Paystack again
+        if transaction.status == 'completed':
+            return jsonify({'status': 'success', 'message': 'Payment verified successfully'})
+        if transaction.status == 'failed':
+            return jsonify({'status': 'error', 'message': 'Payment failed'})
+        
         # Verify payment with Paystack
         verification_response = verify_paystack_payment(reference)
         
         if verification_response['status']:
             payment_data = verification_response['data']
             
-            # Find the transaction
-            transaction = Transaction.query.filter_by(
-                reference=reference,
-                user_id=current_user.id
-            ).first()
-            
-            if transaction:
-                if payment_data['status'] == 'success':
-                    # Update transaction status
-                    transaction.status = 'completed'
-                    transaction.completed_at = datetime.utcnow()
-                    
-                    # Create success notification
-                    notification = Notification(
-                        user_id=current_user.id,
-                        title='Deposit Successful',
-                        message=f'₦{transaction.amount:,.2f} has been deposited successfully to your account.',
-                        type='success'
-                    )
-                    db.session.add(notification)
-                    db.session.commit()
-                    
-                    return jsonify({'status': 'success', 'message': 'Payment verified successfully'})
-                else:
-                    # Mark transaction as failed
-                    transaction.status = 'failed'
-                    db.session.commit()
-                    
-                    return jsonify({'status': 'error', 'message': 'Payment failed'})
+            if payment_data['status'] == 'success':
+                complete_deposit(transaction)
+                db.session.commit()
+                
+                return jsonify({'status': 'success', 'message': 'Payment verified successfully'})
             else:
-                return jsonify({'status': 'error', 'message': 'Transaction not found'})
+                # Mark transaction as failed
+                transaction.mark_failed()
+                db.session.commit()
+                
+                return jsonify({'status': 'error', 'message': 'Payment failed'})
         else:
             return jsonify({'status': 'error', 'message': 'Payment verification failed'})
             
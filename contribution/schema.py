@@ -0,0 +1,86 @@
+"""
+Dialect-neutral schema upgrades
+
+`flask schema upgrade` brings an existing SQLite or PostgreSQL database up
+to the models: it creates missing tables (filling the ones derived from
+existing data), adds the columns that were added to existing tables later
+(running their backfills) and creates missing indexes. Column and index
+definitions come from models.py only, and every step checks the live
+schema first, so it is safe to run on every deploy. New columns and indexes
+belong here rather than in one-off SQLite migration scripts.
+"""
+
+from sqlalchemy.schema import CreateColumn
+
+from models import db, User, compute_user_balances, reconcile_unread_counts, rebuild_rollups
+
+def _backfill_balances():
+    expected = compute_user_balances()
+    updates = [{'id': uid, 'balance': expected.get(uid, 0.0)} for (uid,) in db.session.query(User.id)]
+    if updates:
+        db.session.execute(db.update(User), updates)
+    db.session.commit()
+
+def _backfill_unread_counts():
+    reconcile_unread_counts()
+
+def _backfill_rollups():
+    rebuild_rollups([uid for (uid,) in db.session.query(User.id).order_by(User.id)])
+
+# Tables derived from existing data, filled when they are first created
+DERIVED_TABLES = {
+    'transaction_rollup': _backfill_rollups,
+}
+
+# Columns added to existing tables after they were first created, in order
+ADDED_COLUMNS = [
+    ('bank_account', 'bank_code', None),
+    ('user', 'balance', _backfill_balances),
+    ('user', 'data_version', None),
+    ('user', 'unread_notification_count', _backfill_unread_counts),
+    ('user', 'is_admin', None),
+]
+
+def add_column(connection, column):
+    preparer = connection.dialect.identifier_preparer
+    definition = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.exec_driver_sql(f'ALTER TABLE {preparer.format_table(column.table)} ADD COLUMN {definition}')
+
+def upgrade():
+    """Apply every missing table, column and index; returns the changes made"""
+    engine = db.engine
+    changes = []
+
+    existing_tables = set(db.inspect(engine).get_table_names())
+    db.create_all()
+    new_tables = [name for name in db.metadata.tables if name not in existing_tables]
+    changes += [f'table {name}' for name in new_tables]
+
+    inspector = db.inspect(engine)
+    for table_name, column_name, backfill in ADDED_COLUMNS:
+        if column_name in {column['name'] for column in inspector.get_columns(table_name)}:
+            continue
+        with engine.begin() as connection:
+            add_column(connection, db.metadata.tables[table_name].c[column_name])
+        if backfill is not None:
+            backfill()
+        changes.append(f'column {table_name}.{column_name}')
+
+    # Once every column is in place; an empty database has nothing to derive from
+    if existing_tables:
+        for name in new_tables:
+            if name in DERIVED_TABLES:
+                DERIVED_TABLES[name]()
+
+    for table in db.metadata.sorted_tables:
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(engine)
+                changes.append(f'index {index.name}')
+
+    if changes:
+        # Refresh planner statistics so new indexes get used
+        with engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+    return changes
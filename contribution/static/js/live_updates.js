@@ -0,0 +1,80 @@
+// Live updates pushed over server-sent events, with a polling fallback
+const LiveUpdates = (function() {
+    const script = document.currentScript;
+    const streamUrl = script.dataset.streamUrl;
+    const unreadCountUrl = script.dataset.unreadCountUrl;
+    const pollInterval = 30000;
+    const maxStreamFailures = 3;
+
+    const handlers = {};
+    let failures = 0;
+    let pollTimer = null;
+
+    function on(kind, handler) {
+        (handlers[kind] = handlers[kind] || []).push(handler);
+    }
+
+    function emit(kind, data) {
+        (handlers[kind] || []).forEach(handler => handler(data));
+    }
+
+    // Fallback: poll the unread count and let listeners refresh on each tick
+    function poll() {
+        fetch(unreadCountUrl)
+            .then(response => response.json())
+            .then(data => emit('notifications', data))
+            .catch(error => console.error('Error:', error));
+        emit('balance', {});
+    }
+
+    function startPolling() {
+        if (pollTimer) {
+            return;
+        }
+        poll();
+        pollTimer = setInterval(poll, pollInterval);
+    }
+
+    function connect() {
+        if (!window.EventSource) {
+            startPolling();
+            return;
+        }
+
+        const source = new EventSource(streamUrl);
+        ['notifications', 'balance', 'transfer'].forEach(kind => {
+            source.addEventListener(kind, function(e) {
+                failures = 0;
+                emit(kind, JSON.parse(e.data));
+            });
+        });
+
+        // EventSource reconnects on its own (sending Last-Event-ID) when the
+        // server ends the stream; give up and poll if it keeps failing.
+        source.onerror = function() {
+            failures += 1;
+            if (failures >= maxStreamFailures) {
+                source.close();
+                startPolling();
+            }
+        };
+    }
+
+    // Keep the navbar badge in step on every page
+    on('notifications', function(data) {
+        const countElement = document.getElementById('notification-count');
+        if (!countElement) {
+            return;
+        }
+        if (data.count > 0) {
+            countElement.textContent = data.count;
+            countElement.style.display = 'inline-block';
+        } else {
+            countElement.style.display = 'none';
+        }
+    });
+
+    document.addEventListener('DOMContentLoaded', connect);
+
+    return { on: on };
+})();
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# config.py reads DATABASE_URL when it is imported
+_db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app  # noqa: E402
+from models import db, User, Transaction, BankAccount  # noqa: E402
+
+@pytest.fixture
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+
+@pytest.fixture
+def user(app):
+    user = User(username='alice', email='alice@example.com', first_name='Alice', last_name='Ade')
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def bank_account(user):
+    account = BankAccount(user_id=user.id, bank_name='Test Bank', account_number='0123456789',
+                          account_name='ALICE ADE', bank_code='058', is_verified=True)
+    db.session.add(account)
+    db.session.commit()
+    return account
+
+@pytest.fixture
+def funded(user):
+    """Give the user a completed deposit of 5,000"""
+    db.session.add(Transaction(user_id=user.id, amount=5000.0, type='deposit', status='completed',
+                               payment_method='paystack', reference='DEP_FUNDED'))
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def client(app, user):
+    client = app.test_client()
+    response = client.post('/login', data={'email': user.email, 'password': 'password'})
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,38 @@
+from models import db, User, Transaction, compute_user_balances
+
+def _balance(user):
+    return db.session.get(User, user.id).balance
+
+def test_deposit_counts_once_completed(user):
+    deposit = Transaction(user_id=user.id, amount=5000.0, type='deposit', status='pending',
+                          payment_method='paystack', reference='DEP_PENDING')
+    db.session.add(deposit)
+    db.session.commit()
+    assert _balance(user) == 0.0
+
+    deposit.mark_completed()
+    db.session.commit()
+    assert _balance(user) == 5000.0
+    assert compute_user_balances(user.id) == {user.id: 5000.0}
+
+def test_withdrawal_counts_until_failed(user, funded):
+    withdrawal = Transaction(user_id=user.id, amount=1500.0, type='withdrawal', status='pending',
+                             payment_method='paystack', reference='WDR_PENDING')
+    db.session.add(withdrawal)
+    db.session.commit()
+    assert _balance(user) == 3500.0
+
+    withdrawal.mark_failed()
+    db.session.commit()
+    assert _balance(user) == 5000.0
+    assert compute_user_balances(user.id) == {user.id: 5000.0}
+
+def test_pending_deposit_cannot_be_withdrawn(client, user, bank_account):
+    db.session.add(Transaction(user_id=user.id, amount=5000.0, type='deposit', status='pending',
+                               payment_method='paystack', reference='DEP_UNPAID'))
+    db.session.commit()
+
+    response = client.post('/withdraw', data={'amount': '5000', 'bank_account_id': bank_account.id})
+
+    assert response.get_json()['status'] == 'error'
+    assert Transaction.query.filter_by(type='withdrawal').count() == 0
@@ -0,0 +1,14 @@
+def test_metrics_disabled_without_token(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', None)
+
+    assert app.test_client().get('/metrics').status_code == 404
+
+def test_metrics_requires_token(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-secret')
+    client = app.test_client()
+
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert b'msw_request_duration_seconds' in response.data
@@ -0,0 +1,27 @@
+import pytest
+
+from models import db, Transaction
+from paystack_client import to_kobo
+from webhooks import apply_event
+
+@pytest.mark.parametrize('amount, kobo', [(1.13, 113), (0.29, 29), (4.35, 435), (1000.0, 100000)])
+def test_to_kobo_rounds(amount, kobo):
+    assert to_kobo(amount) == kobo
+
+@pytest.mark.parametrize('status', ['pending', 'failed'])
+def test_charge_success_completes_deposit_with_cents(user, status):
+    deposit = Transaction(user_id=user.id, amount=1.13, type='deposit', status=status,
+                          payment_method='paystack', reference='DEP_CENTS')
+    db.session.add(deposit)
+    db.session.commit()
+
+    assert apply_event('charge.success', {'reference': 'DEP_CENTS', 'amount': 113}) is None
+    db.session.commit()
+    assert deposit.status == 'completed'
+
+def test_charge_success_ignores_short_amount(user):
+    db.session.add(Transaction(user_id=user.id, amount=1.13, type='deposit', status='pending',
+                               payment_method='paystack', reference='DEP_SHORT'))
+    db.session.commit()
+
+    assert apply_event('charge.success', {'reference': 'DEP_SHORT', 'amount': 112}) is not None
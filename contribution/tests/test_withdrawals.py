@@ -0,0 +1,38 @@
+import pytest
+
+from models import db, User, Transaction, Job
+from withdrawals import request_withdrawal
+
+def _withdrawals(user):
+    return Transaction.query.filter_by(user_id=user.id, type='withdrawal').all()
+
+@pytest.mark.parametrize('amount', ['-5000', '0', 'nan', 'inf', '-inf', 'abc', ''])
+def test_withdraw_rejects_invalid_amounts(client, funded, bank_account, amount):
+    response = client.post('/withdraw', data={'amount': amount, 'bank_account_id': bank_account.id})
+
+    assert response.get_json()['status'] == 'error'
+    assert _withdrawals(funded) == []
+    assert Job.query.count() == 0
+    assert db.session.get(User, funded.id).balance == 5000.0
+
+def test_withdraw_rejects_missing_amount(client, funded, bank_account):
+    response = client.post('/withdraw', data={'bank_account_id': bank_account.id})
+
+    assert response.get_json()['status'] == 'error'
+    assert _withdrawals(funded) == []
+
+def test_withdraw_queues_valid_amount(client, funded, bank_account):
+    response = client.post('/withdraw', data={'amount': '1500', 'bank_account_id': bank_account.id})
+
+    assert response.get_json()['status'] == 'success'
+    [withdrawal] = _withdrawals(funded)
+    assert withdrawal.amount == 1500.0 and withdrawal.status == 'pending'
+    assert db.session.get(User, funded.id).balance == 3500.0
+
+@pytest.mark.parametrize('amount', [-5000.0, 0.0, float('nan'), float('inf')])
+def test_request_withdrawal_rejects_invalid_amounts(funded, bank_account, amount):
+    with pytest.raises(ValueError):
+        request_withdrawal(funded, bank_account, amount)
+    db.session.rollback()
+
+    assert _withdrawals(funded) == []
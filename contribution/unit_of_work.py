@@ -0,0 +1,47 @@
+"""
+One commit per write
+
+Write routes stage everything a request changes on the session -- the row
+it creates, the notifications that go with it (notify) and any jobs
+(jobs.enqueue) -- and commit once, so a write costs one transaction
+instead of one per row.
+
+after_commit(fn, *args) defers in-process work until the transaction has
+committed and drops it if the transaction rolls back. Deferred functions
+run inside the session's commit hook and must not use the session; work
+that needs the database belongs in a job.
+"""
+
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Notification
+
+logger = logging.getLogger(__name__)
+
+def notify(user, title, message, type='success'):
+    """Stage a notification for user in the current transaction"""
+    if user.id is None:
+        # A user created in this request needs its id first
+        db.session.flush()
+    notification = Notification(user_id=user.id, title=title, message=message, type=type)
+    db.session.add(notification)
+    return notification
+
+def after_commit(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) once the current transaction commits"""
+    db.session.info.setdefault('after_commit', []).append((fn, args, kwargs))
+
+@event.listens_for(Session, 'after_commit')
+def _run_deferred(session):
+    for fn, args, kwargs in session.info.pop('after_commit', ()):
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            logger.exception('Deferred %s raised after commit', getattr(fn, '__qualname__', fn))
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_deferred(session):
+    session.info.pop('after_commit', None)
@@ -1,28 +1,17 @@
 import os
-import secrets
-from PIL import Image
 from flask import current_app, url_for
 from flask_mail import Message
-from paystackapi.paystack import Paystack
-from paystackapi.transaction import Transaction as PaystackTransaction
-import requests
+from paystack_client import get_paystack_client, PaystackError, to_kobo
+from images import process_upload
 import random
 import string
 
 def save_picture(form_picture):
-    """Save uploaded profile picture and return filename"""
-    random_hex = secrets.token_hex(8)
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex + f_ext
-    picture_path = os.path.join(current_app.root_path, 'static/images', picture_fn)
-    
-    # Resize image
-    output_size = (125, 125)
-    i = Image.open(form_picture)
-    i.thumbnail(output_size)
-    i.save(picture_path)
-    
-    return picture_fn
+    """Queue an uploaded profile picture for processing and return its name
+
+    Raises ValueError if the upload isn't a supported image.
+    """
+    return process_upload(form_picture)
 
 def send_reset_email(user):
     """Send password reset email"""
@@ -43,28 +32,37 @@ def generate_reference():
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
 
 def init_paystack_payment(email, amount, reference):
-    """Initialize Paystack payment"""
-    paystack = Paystack(secret_key=current_app.config['sk_test_4c623beabaa6f43be5fc5872756186bc764118c1'])
-    
+    """Initialize Paystack payment of amount naira"""
     try:
-        response = paystack.transaction.initialize(
-            email=email,
-            amount=amount,
-            reference=reference
-        )
-        return response
-    except Exception as e:
-        return {'status': False, 'message': str(e)}
+        return get_paystack_client().post('/transaction/initialize', name='init_paystack_payment', json={
+            'email': email,
+            'amount': to_kobo(amount),
+            'reference': reference
+        })
+    except PaystackError as e:
+        return {'status': False, 'message': str(e), 'retryable': True}
 
 def verify_paystack_payment(reference):
-    """Verify Paystack payment"""
-    paystack = Paystack(secret_key=current_app.config['sk_test_4c623beabaa6f43be5fc5872756186bc764118c1/'])
-    
+    """Verify Paystack payment
+
+    A reference Paystack has no transaction for comes back with 'not_found'
+    set; rate limits and server errors come back retryable, like network
+    failures.
+    """
     try:
-        response = paystack.transaction.verify(reference)
-        return response
-    except Exception as e:
-        return {'status': False, 'message': str(e)}
+        status_code, response = get_paystack_client().request_with_status(
+            'GET', f'/transaction/verify/{reference}', name='verify_paystack_payment'
+        )
+    except PaystackError as e:
+        return {'status': False, 'message': str(e), 'retryable': True}
+
+    message = response.get('message') or f'HTTP {status_code}'
+    # Paystack answers an unknown reference with 400 "Transaction reference not found"
+    if status_code == 404 or (status_code == 400 and 'not found' in message.lower()):
+        return {'status': False, 'message': message, 'not_found': True}
+    if status_code == 429 or status_code >= 500:
+        return {'status': False, 'message': message, 'retryable': True}
+    return response
 
 def format_currency(amount):
     """Format amount as currency"""
@@ -78,7 +76,7 @@ def calculate_savings_rate(income, savings):
 
 def get_monthly_summary(user_id, year=None, month=None):
     """Get monthly financial summary"""
-    from models import Transaction
+    from models import sum_rollups
     from datetime import datetime
     
     if year is None:
@@ -86,28 +84,10 @@ def get_monthly_summary(user_id, year=None, month=None):
     if month is None:
         month = datetime.utcnow().month
     
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
-    else:
-        end_date = datetime(year, month + 1, 1)
-    
-    transactions = Transaction.query.filter(
-        Transaction.user_id == user_id,
-        Transaction.created_at >= start_date,
-        Transaction.created_at < end_date,
-        Transaction.status == 'completed'
-    ).all()
-    
-    total_deposits = sum(t.amount for t in transactions if t.type == 'deposit')
-    total_withdrawals = sum(t.amount for t in transactions if t.type == 'withdrawal')
+    start_date = datetime(year, month, 1).date()
     
-    return {
-        'total_deposits': total_deposits,
-        'total_withdrawals': total_withdrawals,
-        'net_savings': total_deposits - total_withdrawals,
-        'transaction_count': len(transactions)
-    }
+    # Read the precomputed monthly rollup instead of the raw transactions
+    return sum_rollups(user_id, 'month', start_date, start_date)
 
 def get_financial_insights(user_id):
     """Generate financial insights for user"""
@@ -149,26 +129,13 @@ def get_financial_insights(user_id):
 
 def validate_bank_account(account_number, bank_code):
     """Validate bank account using Paystack"""
-    paystack = Paystack(secret_key=current_app.config['sk_test_4c623beabaa6f43be5fc5872756186bc764118c1'])
-    
-    try:
-        response = paystack.verification.resolve_account(
-            account_number=account_number,
-            bank_code=bank_code
-        )
-        return response
-    except Exception as e:
-        return {'status': False, 'message': str(e)}
+    from utils_paystack_transfer import validate_bank_details
+    return validate_bank_details(account_number, bank_code)
 
 def get_banks_list():
     """Get list of Nigerian banks"""
-    paystack = Paystack(secret_key=current_app.config['sk_test_4c623beabaa6f43be5fc5872756186bc764118c1'])
-    
-    try:
-        response = paystack.misc.list_banks()
-        return response
-    except Exception as e:
-        return {'status': False, 'message': str(e)}
+    from utils_paystack_transfer import get_banks_list as list_banks
+    return list_banks()
 
 def send_sms_notification(phone, message):
     """Send SMS notification (placeholder for SMS service integration)"""
@@ -178,7 +145,7 @@ def send_sms_notification(phone, message):
 
 def generate_report(user_id, report_type='monthly'):
     """Generate financial report"""
-    from models import Transaction, Goal
+    from models import Transaction, Goal, sum_rollups
     from datetime import datetime, timedelta
     
     if report_type == 'monthly':
@@ -191,6 +158,9 @@ def generate_report(user_id, report_type='monthly'):
         start_date = datetime.utcnow().replace(month=1, day=1)
         end_date = datetime.utcnow()
     
+    # Whole days, so the listed transactions match the day-bucketed rollups
+    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    
     transactions = Transaction.query.filter(
         Transaction.user_id == user_id,
         Transaction.created_at >= start_date,
@@ -198,6 +168,12 @@ def generate_report(user_id, report_type='monthly'):
         Transaction.status == 'completed'
     ).all()
     
+    # Totals come from the rollups: daily rows for weekly reports, monthly otherwise
+    if report_type == 'weekly':
+        summary = sum_rollups(user_id, 'day', start_date.date(), end_date.date())
+    else:
+        summary = sum_rollups(user_id, 'month', start_date.date().replace(day=1), end_date.date())
+    
     goals = Goal.query.filter(
         Goal.user_id == user_id,
         Goal.created_at >= start_date,
@@ -206,6 +182,7 @@ def generate_report(user_id, report_type='monthly'):
     
     return {
         'transactions': transactions,
+        'summary': summary,
         'goals': goals,
         'report_type': report_type,
         'start_date': start_date,
@@ -1,19 +1,15 @@
 """
 Paystack Transfer Integration for Nigerian Bank Transfers
+
+Network failures come back as {'status': False, 'retryable': True, ...} so
+callers can tell them apart from requests Paystack rejected.
 """
 
-import requests
-from flask import current_app
+from paystack_client import get_paystack_client, PaystackError, to_kobo
 
 def create_transfer_recipient(name, account_number, bank_code):
     """Create a transfer recipient for Nigerian bank transfers"""
     try:
-        url = "https://api.paystack.co/transferrecipient"
-        headers = {
-            "Authorization": f"Bearer {current_app.config['PAYSTACK_SECRET_KEY']}",
-            "Content-Type": "application/json"
-        }
-        
         data = {
             "type": "nuban",
             "name": name,
@@ -22,96 +18,90 @@ def create_transfer_recipient(name, account_number, bank_code):
             "currency": "NGN"
         }
         
-        response = requests.post(url, headers=headers, json=data)
-        return response.json()
+        return get_paystack_client().post("/transferrecipient", name="create_transfer_recipient", json=data)
         
-    except Exception as e:
-        return {'status': False, 'message': str(e)}
+    except PaystackError as e:
+        return {'status': False, 'message': str(e), 'retryable': True}
 
 def initiate_bank_transfer(amount, recipient_code, reference):
     """Initiate bank transfer to Nigerian bank account"""
     try:
-        url = "https://api.paystack.co/transfer"
-        headers = {
-            "Authorization": f"Bearer {current_app.config['PAYSTACK_SECRET_KEY']}",
-            "Content-Type": "application/json"
-        }
-        
         data = {
             "source": "balance",
-            "amount": int(amount * 100),  # Convert to kobo
+            "amount": to_kobo(amount),
             "recipient": recipient_code,
             "reference": reference
         }
         
-        response = requests.post(url, headers=headers, json=data)
-        return response.json()
+        return get_paystack_client().post("/transfer", name="initiate_bank_transfer", json=data)
         
-    except Exception as e:
-        return {'status': False, 'message': str(e)}
+    except PaystackError as e:
+        return {'status': False, 'message': str(e), 'retryable': True}
 
-def verify_transfer_status(transfer_code):
-    """Verify the status of a bank transfer"""
+def initiate_bulk_transfer(transfers):
+    """Initiate up to 100 transfers in one request
+
+    transfers is a list of {'amount', 'recipient_code', 'reference'} dicts;
+    the response data lists the per-transfer results with their references.
+    """
     try:
-        url = f"https://api.paystack.co/transfer/{transfer_code}"
-        headers = {
-            "Authorization": f"Bearer {current_app.config['PAYSTACK_SECRET_KEY']}",
-            "Content-Type": "application/json"
+        data = {
+            "currency": "NGN",
+            "source": "balance",
+            "transfers": [
+                {
+                    "amount": to_kobo(transfer['amount']),
+                    "recipient": transfer['recipient_code'],
+                    "reference": transfer['reference']
+                }
+                for transfer in transfers
+            ]
         }
         
-        response = requests.get(url, headers=headers)
-        return response.json()
+        return get_paystack_client().post("/transfer/bulk", name="initiate_bulk_transfer", json=data)
         
-    except Exception as e:
-        return {'status': False, 'message': str(e)}
+    except PaystackError as e:
+        return {'status': False, 'message': str(e), 'retryable': True}
+
+def verify_transfer_by_reference(reference):
+    """Look up a transfer by the reference it was initiated with
 
-def list_transfer_recipients():
-    """List all transfer recipients"""
+    A reference Paystack has no transfer for comes back with 'not_found'
+    set; rate limits and server errors come back retryable, like network
+    failures.
+    """
     try:
-        url = "https://api.paystack.co/transferrecipient"
-        headers = {
-            "Authorization": f"Bearer {current_app.config['PAYSTACK_SECRET_KEY']}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.get(url, headers=headers)
-        return response.json()
-        
-    except Exception as e:
-        return {'status': False, 'message': str(e)}
+        status_code, response = get_paystack_client().request_with_status(
+            'GET', f"/transfer/verify/{reference}", name="verify_transfer_by_reference"
+        )
+    except PaystackError as e:
+        return {'status': False, 'message': str(e), 'retryable': True}
+
+    message = response.get('message') or f'HTTP {status_code}'
+    if status_code == 404:
+        return {'status': False, 'message': message, 'not_found': True}
+    if status_code == 429 or status_code >= 500:
+        return {'status': False, 'message': message, 'retryable': True}
+    return response
 
 def get_banks_list():
     """Get list of Nigerian banks with codes"""
     try:
-        url = "https://api.paystack.co/bank"
-        headers = {
-            "Authorization": f"Bearer {current_app.config['PAYSTACK_SECRET_KEY']}",
-            "Content-Type": "application/json"
-        }
-        
         params = {"country": "nigeria", "perPage": 100}
-        response = requests.get(url, headers=headers, params=params)
-        return response.json()
+        return get_paystack_client().get("/bank", name="get_banks_list", params=params)
         
-    except Exception as e:
-        return {'status': False, 'message': str(e)}
+    except PaystackError as e:
+        return {'status': False, 'message': str(e), 'retryable': True}
 
 def validate_bank_details(account_number, bank_code):
     """Validate bank account details"""
     try:
-        url = "https://api.paystack.co/bank/resolve"
-        headers = {
-            "Authorization": f"Bearer {current_app.config['PAYSTACK_SECRET_KEY']}",
-            "Content-Type": "application/json"
-        }
-        
         params = {
             "account_number": account_number,
             "bank_code": bank_code
         }
         
-        response = requests.get(url, headers=headers, params=params)
-        return response.json()
+        return get_paystack_client().get("/bank/resolve", name="validate_bank_details", params=params)
         
-    except Exception as e:
-        return {'status': False, 'message': str(e)}
+    except PaystackError as e:
+        return {'status': False, 'message': str(e), 'retryable': True}
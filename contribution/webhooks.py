@@ -0,0 +1,123 @@
+"""
+Paystack webhook ingestion
+
+The webhook route checks the x-paystack-signature HMAC, stores the raw
+delivery as a WebhookEvent and queues a job in the same commit, then
+answers straight away. The job applies the event by reference through the
+ORM, so balances, rollups and notifications follow the usual mapper events,
+and a deposit or withdrawal settled this way needs no verify call at all.
+Applying an event is idempotent: identical redeliveries are dropped on
+event_key, and an event for a transaction that has already moved on is
+recorded as ignored. The exception is a deposit failed provisionally (by
+verify-payment or the reconciler seeing an abandoned checkout) that
+Paystack then charged: a signed charge.success for the full amount still
+completes it, so the customer isn't charged without being credited.
+"""
+
+import hashlib
+import hmac
+import json
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Transaction, Notification, WebhookEvent
+from jobs import job_handler, enqueue
+from withdrawals import complete_withdrawal, fail_withdrawal
+from paystack_client import to_kobo
+
+HANDLED_EVENTS = ('charge.success', 'transfer.success', 'transfer.failed', 'transfer.reversed')
+
+def sign(secret, body):
+    return hmac.new(secret.encode(), body, hashlib.sha512).hexdigest()
+
+def verify_signature(secret, body, signature):
+    return bool(signature) and hmac.compare_digest(sign(secret, body), signature)
+
+def record_event(body):
+    """Store a verified delivery and queue it; returns (event, created)
+
+    Unhandled event types are stored as ignored and not queued.
+    """
+    data = json.loads(body)
+    event_key = hashlib.sha256(body).hexdigest()
+    existing = WebhookEvent.query.filter_by(event_key=event_key).first()
+    if existing is not None:
+        return existing, False
+
+    handled = data.get('event') in HANDLED_EVENTS
+    webhook_event = WebhookEvent(
+        event_key=event_key,
+        event=data.get('event') or 'unknown',
+        reference=(data.get('data') or {}).get('reference'),
+        payload=body.decode(),
+        status='received' if handled else 'ignored'
+    )
+    db.session.add(webhook_event)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # A concurrent redelivery got there first
+        db.session.rollback()
+        return WebhookEvent.query.filter_by(event_key=event_key).first(), False
+
+    if handled:
+        enqueue('paystack_webhook', {'webhook_event_id': webhook_event.id})
+    return webhook_event, True
+
+def complete_deposit(transaction):
+    transaction.mark_completed()
+    notification = Notification(
+        user_id=transaction.user_id,
+        title='Deposit Successful',
+        message=f'₦{transaction.amount:,.2f} has been deposited successfully to your account.',
+        type='success'
+    )
+    db.session.add(notification)
+
+def apply_event(event, data):
+    """Apply one event to its transaction; returns why it was ignored, or None"""
+    reference = data.get('reference')
+    transaction = Transaction.query.filter_by(reference=reference).first() if reference else None
+    if transaction is None:
+        return f'No transaction with reference {reference!r}'
+
+    if event == 'charge.success':
+        if transaction.type != 'deposit':
+            return 'Reference is not a deposit'
+        if transaction.status == 'completed':
+            return 'Deposit is already completed'
+        if data.get('amount') != to_kobo(transaction.amount):
+            return f"Amount {data.get('amount')} does not match the deposit"
+        # A pending or provisionally failed deposit; the ledger and rollups
+        # follow the status change either way
+        complete_deposit(transaction)
+        return None
+
+    if transaction.type != 'withdrawal':
+        return 'Reference is not a withdrawal'
+    if event == 'transfer.success':
+        if transaction.status != 'pending':
+            return f'Withdrawal is already {transaction.status}'
+        complete_withdrawal(transaction)
+    elif event == 'transfer.failed':
+        if transaction.status != 'pending':
+            return f'Withdrawal is already {transaction.status}'
+        fail_withdrawal(transaction)
+    elif event == 'transfer.reversed':
+        if transaction.status == 'failed':
+            return 'Withdrawal is already failed'
+        fail_withdrawal(transaction, 'The transfer was reversed.')
+    return None
+
+@job_handler('paystack_webhook')
+def process_webhook_event(job):
+    webhook_event = db.session.get(WebhookEvent, job.get_payload()['webhook_event_id'])
+    if webhook_event is None or webhook_event.status != 'received':
+        return
+
+    payload = webhook_event.get_payload()
+    reason = apply_event(webhook_event.event, payload.get('data') or {})
+    webhook_event.status = 'ignored' if reason else 'processed'
+    webhook_event.error = reason
+    webhook_event.processed_at = datetime.utcnow()
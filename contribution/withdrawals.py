@@ -0,0 +1,210 @@
+"""
+Withdrawals to users' bank accounts
+
+The withdraw route only records the pending withdrawal and queues a job in
+the same commit; the job worker makes the Paystack calls (create the
+transfer recipient if needed, then initiate the transfer). The pending
+withdrawal already counts against the balance, so it can't be spent twice
+while the transfer is in flight, and failing it gives the money back.
+
+Withdrawal jobs are batched: queued withdrawals are gathered for up to
+WITHDRAWAL_BATCH_WINDOW seconds (or until WITHDRAWAL_BATCH_SIZE are waiting)
+and sent as one Paystack bulk transfer, with the per-transfer results
+mapped back onto the transactions by reference.
+
+A retried job first looks its reference up on Paystack, since an earlier
+attempt may have sent the transfer before failing. A withdrawal is only
+failed (and refunded) once Paystack has said the transfer failed or that
+it never received one; anything else stays pending for the webhook or the
+reconciler.
+"""
+
+import logging
+import math
+
+from models import db, Transaction, BankAccount, Notification
+from jobs import job_handler, enqueue, JobError
+from utils import generate_reference
+from utils_paystack_transfer import (create_transfer_recipient, initiate_bank_transfer, initiate_bulk_transfer,
+                                     verify_transfer_by_reference)
+
+logger = logging.getLogger(__name__)
+
+def request_withdrawal(user, bank_account, amount):
+    """Record a pending withdrawal and queue its transfer; the caller commits
+
+    Raises ValueError unless amount is a positive, finite number.
+    """
+    if not (amount > 0 and math.isfinite(amount)):
+        raise ValueError(f'Invalid withdrawal amount {amount!r}')
+    transaction = Transaction(
+        user_id=user.id,
+        amount=amount,
+        type='withdrawal',
+        description=f'Withdrawal to {bank_account.bank_name} - {bank_account.account_number}',
+        payment_method='paystack',
+        reference=generate_reference(),
+        status='pending'
+    )
+    db.session.add(transaction)
+
+    notification = Notification(
+        user_id=user.id,
+        title='Withdrawal Initiated',
+        message=f'₦{amount:,.2f} withdrawal has been initiated to your bank account. Transfer will be processed shortly.',
+        type='info'
+    )
+    db.session.add(notification)
+
+    enqueue('withdrawal', {'reference': transaction.reference, 'bank_account_id': bank_account.id})
+    return transaction
+
+def complete_withdrawal(transaction):
+    transaction.mark_completed()
+    notification = Notification(
+        user_id=transaction.user_id,
+        title='Withdrawal Completed',
+        message=f'₦{transaction.amount:,.2f} has been successfully transferred to your bank account.',
+        type='success'
+    )
+    db.session.add(notification)
+
+def fail_withdrawal(transaction, reason='Please try again.'):
+    transaction.mark_failed()
+    notification = Notification(
+        user_id=transaction.user_id,
+        title='Withdrawal Failed',
+        message=f'Withdrawal of ₦{transaction.amount:,.2f} failed. {reason}',
+        type='error'
+    )
+    db.session.add(notification)
+
+def _settle_from_paystack(transaction):
+    """Settle a withdrawal from the transfer Paystack has for its reference
+
+    Returns False if Paystack has no transfer with that reference, True if
+    it has one (a transfer still in flight is left pending). Raises JobError
+    if Paystack couldn't tell.
+    """
+    response = verify_transfer_by_reference(transaction.reference)
+    if response.get('not_found'):
+        return False
+    if not response.get('status'):
+        raise JobError(response.get('message') or 'Could not look up the transfer')
+
+    transfer = response.get('data') or {}
+    if transfer.get('status') == 'success':
+        complete_withdrawal(transaction)
+    elif transfer.get('status') in ('failed', 'reversed'):
+        fail_withdrawal(transaction, transfer.get('reason') or 'Transfer failed')
+    return True
+
+def _withdrawal_gave_up(job, error):
+    transaction = Transaction.query.filter_by(reference=job.get_payload()['reference']).first()
+    if transaction is None or transaction.status != 'pending':
+        return
+    # Only refund if no transfer went out
+    try:
+        if not _settle_from_paystack(transaction):
+            fail_withdrawal(transaction)
+    except JobError as e:
+        logger.warning('Withdrawal %s left pending for the reconciler: %s', transaction.reference, e)
+
+def _prepare_transfer(job):
+    """Load a withdrawal job's transaction and make sure it has a recipient
+
+    Returns (transaction, bank_account), or None if there is nothing left to
+    transfer.
+    """
+    payload = job.get_payload()
+    transaction = Transaction.query.filter_by(reference=payload['reference']).first()
+    if transaction is None or transaction.status != 'pending':
+        return None
+
+    bank_account = db.session.get(BankAccount, payload['bank_account_id'])
+    if bank_account is None or bank_account.user_id != transaction.user_id:
+        fail_withdrawal(transaction, 'The bank account no longer exists.')
+        return None
+
+    if job.attempts > 1 and _settle_from_paystack(transaction):
+        # An earlier attempt reached Paystack before it failed
+        return None
+
+    if not bank_account.recipient_code:
+        recipient_response = create_transfer_recipient(
+            name=bank_account.account_name,
+            account_number=bank_account.account_number,
+            bank_code=bank_account.bank_code
+        )
+        if recipient_response.get('retryable'):
+            raise JobError(recipient_response['message'])
+        if not recipient_response.get('status'):
+            fail_withdrawal(transaction, 'Failed to create transfer recipient.')
+            return None
+        bank_account.recipient_code = recipient_response['data']['recipient_code']
+
+    return transaction, bank_account
+
+def process_withdrawal(job):
+    """Create the recipient if needed and initiate the Paystack transfer"""
+    prepared = _prepare_transfer(job)
+    if prepared is None:
+        return
+    transaction, bank_account = prepared
+
+    transfer_response = initiate_bank_transfer(
+        amount=transaction.amount,
+        recipient_code=bank_account.recipient_code,
+        reference=transaction.reference
+    )
+    if transfer_response.get('retryable'):
+        raise JobError(transfer_response['message'])
+    if not transfer_response.get('status'):
+        fail_withdrawal(transaction, transfer_response.get('message', 'Transfer failed'))
+
+@job_handler('withdrawal', on_failure=_withdrawal_gave_up,
+             batch_size='WITHDRAWAL_BATCH_SIZE', batch_window='WITHDRAWAL_BATCH_WINDOW')
+def process_withdrawals(jobs):
+    """Initiate a batch of withdrawals with one bulk transfer request"""
+    if len(jobs) == 1:
+        process_withdrawal(jobs[0])
+        return
+
+    # One bad withdrawal fails only its own job; _prepare_transfer raises
+    # before it writes anything
+    failures = {}
+    ready = []
+    for job in jobs:
+        try:
+            prepared = _prepare_transfer(job)
+        except Exception as e:
+            failures[job.id] = e
+            continue
+        if prepared is not None:
+            ready.append(prepared)
+    if not ready:
+        return failures
+
+    transfer_response = initiate_bulk_transfer([
+        {
+            'amount': transaction.amount,
+            'recipient_code': bank_account.recipient_code,
+            'reference': transaction.reference
+        }
+        for transaction, bank_account in ready
+    ])
+    if transfer_response.get('retryable'):
+        raise JobError(transfer_response['message'])
+    if not transfer_response.get('status'):
+        for transaction, _ in ready:
+            fail_withdrawal(transaction, transfer_response.get('message', 'Transfer failed'))
+        return failures
+
+    # Transfers Paystack accepted stay pending until a webhook or the
+    # reconciler settles them
+    results = {item.get('reference'): item for item in transfer_response.get('data') or []}
+    for transaction, _ in ready:
+        result = results.get(transaction.reference) or {}
+        if result.get('status') == 'failed':
+            fail_withdrawal(transaction, result.get('reason') or 'Transfer failed')
+    return failures